@@ -0,0 +1,7 @@
+from .containers import QueryDocs, Run, Qrels
+from .metrics import relevance_matrix, hits_at, vectorized_metrics, precision_at_k, recall_at_k, f_beta, compute_stats
+from .loaders import load_queries, load_ground_truth, load_run
+from .streaming import read_run_chunks, stream_top_k, StreamingEvaluator, evaluate_run_file
+from .cache import cached_arrays
+from .significance import paired_differences, permutation_test, holm_correction, bootstrap_ci, compare_engines
+from .table import MetricTable
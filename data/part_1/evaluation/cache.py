@@ -0,0 +1,70 @@
+import numpy as np
+import tempfile
+import zipfile
+import os
+
+# directory, next to the source file, holding the cached arrays
+CACHE_DIRNAME = ".cache"
+
+# errors of a cache that is missing, corrupted or written by an older version
+CACHE_ERRORS = (OSError, ValueError, EOFError, zipfile.BadZipFile, KeyError)
+
+
+def cache_pathname(pathname, kind):
+    """ Returns the pathname of the cache of a source file
+
+    :param pathname: string
+        the source tsv file
+    :param kind: string
+        what the source file holds, e.g. 'qrels'
+    :return: string
+    """
+    directory, filename = os.path.split(os.path.abspath(pathname))
+    return os.path.join(directory, CACHE_DIRNAME, f"{filename}.{kind}.npz")
+
+
+def cached_arrays(pathname, kind, parse):
+    """ Returns the arrays parsed from pathname, reading them from the cache
+        if the source file did not change since they were saved
+
+    :param pathname: string
+        the source tsv file
+    :param kind: string
+        what the source file holds, e.g. 'qrels'
+    :param parse: function
+        parse(pathname) returns a dictionary {name: numpy array}
+    :return: dictionary {name: numpy array}
+    """
+    stat = os.stat(pathname)
+    source = np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    cached = cache_pathname(pathname, kind)
+
+    # a cache that cannot be read is a miss
+    try:
+        with np.load(cached, allow_pickle=False) as data:
+            if np.array_equal(data['_source'], source):
+                return {name: data[name] for name in data.files if name != '_source'}
+    except CACHE_ERRORS:
+        pass
+
+    arrays = parse(pathname)
+
+    # the cache is an optimization, a read-only directory is not an error
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+
+        # write a file of this process then rename it, so that concurrent
+        # writers and crashes never leave a truncated cache
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cached), suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, _source=source, **arrays)
+            os.replace(tmp, cached)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError:
+        pass
+
+    return arrays
@@ -0,0 +1,101 @@
+from itertools import chain
+import numpy as np
+
+
+class QueryDocs(object):
+    def __init__(self, query_ids, offsets, doc_ids):
+        """ Lists of documents ids of a set of queries stored in columnar (CSR) form:
+            the documents of query_ids[i] are doc_ids[offsets[i]:offsets[i + 1]]
+
+        :param query_ids: numpy array of Q ints
+        :param offsets: numpy array of Q + 1 ints
+        :param doc_ids: numpy array of ints
+        """
+        self.query_ids = np.asarray(query_ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+
+    @classmethod
+    def from_dict(cls, d):
+        """ Returns the columnar form of a dictionary {query_id: list of ids}
+
+        :param d: dictionary {query_id: list of ids}
+        :return: object of the calling class
+        """
+        lengths = np.fromiter(map(len, d.values()), dtype=np.int64, count=len(d))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        doc_ids = np.fromiter(chain.from_iterable(d.values()), dtype=np.int64, count=offsets[-1])
+
+        return cls(np.fromiter(d.keys(), dtype=np.int64, count=len(d)), offsets, doc_ids)
+
+    @classmethod
+    def from_pairs(cls, query_ids, doc_ids):
+        """ Groups the pairs (query_id, doc_id) by query, keeping the order
+            of the documents within each query
+
+        :param query_ids: numpy array of ints
+        :param doc_ids: numpy array of ints
+        :return: object of the calling class
+            queries are sorted by id
+        """
+        order = np.argsort(query_ids, kind="stable")
+        query_ids, doc_ids = np.asarray(query_ids)[order], np.asarray(doc_ids)[order]
+
+        unique, starts = np.unique(query_ids, return_index=True)
+        offsets = np.concatenate([starts, [len(query_ids)]])
+
+        return cls(unique, offsets, doc_ids)
+
+    def to_dict(self):
+        """ Returns the dictionary {query_id: list of ids} """
+        return {int(q): self.doc_ids[self.offsets[i]:self.offsets[i + 1]].tolist()
+                for i, q in enumerate(self.query_ids)}
+
+    def lengths(self):
+        """ Returns the number of documents of each query """
+        return np.diff(self.offsets)
+
+    def rows(self, query_ids):
+        """ Returns the position of each of query_ids in this object, -1 if missing
+
+        :param query_ids: numpy array of ints
+        :return: numpy array of ints
+        """
+        if len(self) == 0:
+            return np.full(len(query_ids), -1)
+
+        order = np.argsort(self.query_ids)
+        sorted_ids = self.query_ids[order]
+        positions = np.clip(np.searchsorted(sorted_ids, query_ids), 0, len(sorted_ids) - 1)
+
+        return np.where(sorted_ids[positions] == query_ids, order[positions], -1)
+
+    def select(self, query_ids):
+        """ Returns a new object with exactly the queries in query_ids, in the same order,
+            queries missing from this object have no documents
+
+        :param query_ids: numpy array of ints
+        :return: object of the same class
+        """
+        query_ids = np.asarray(query_ids, dtype=np.int64)
+        rows = self.rows(query_ids)
+
+        lengths = np.where(rows >= 0, self.lengths()[rows], 0)
+        starts = np.where(rows >= 0, self.offsets[:-1][rows], 0)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        # index of every selected document in doc_ids
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return self.__class__(query_ids, offsets, self.doc_ids[positions])
+
+    def __len__(self):
+        return len(self.query_ids)
+
+
+class Run(QueryDocs):
+    """ Results of a search engine, the documents of each query are sorted by rank """
+
+
+class Qrels(QueryDocs):
+    """ Ground truth, the relevant documents of each query in no particular order """
@@ -0,0 +1,92 @@
+from .containers import Run, Qrels
+from .cache import cached_arrays
+import numpy as np
+import csv
+
+
+def read_tsv(pathname):
+    """ Returns the rows of a tsv file, header excluded
+
+    :param pathname: string
+    :return: list of lists of strings
+    """
+    with open(pathname) as csvfile:
+        reader = csv.reader(csvfile, delimiter='\t')
+
+        # skip header
+        next(reader, None)
+
+        return list(reader)
+
+
+def parse_queries(pathname):
+    """ Parses a queries tsv file with rows "query_id query" into columns """
+    rows = read_tsv(pathname)
+
+    return {'query_ids': np.array([int(query_id) for query_id, _ in rows], dtype=np.int64),
+            'queries': np.array([query for _, query in rows], dtype=str)}
+
+
+def parse_pairs(pathname):
+    """ Parses a ground truth tsv file with rows "query_id doc_id" into a CSR Qrels """
+    pairs = np.array(read_tsv(pathname), dtype=np.int64).reshape(-1, 2)
+    qrels = Qrels.from_pairs(pairs[:, 0], pairs[:, 1])
+
+    return {'query_ids': qrels.query_ids, 'offsets': qrels.offsets, 'doc_ids': qrels.doc_ids}
+
+
+def parse_run(pathname):
+    """ Parses a run tsv file with rows "query_id doc_id rank" into a CSR Run """
+    rows = np.array(read_tsv(pathname), dtype=np.int64).reshape(-1, 3)
+
+    # sort by rank, from_pairs keeps this order within each query
+    rows = rows[np.argsort(rows[:, 2], kind="stable")]
+    run = Run.from_pairs(rows[:, 0], rows[:, 1])
+
+    return {'query_ids': run.query_ids, 'offsets': run.offsets, 'doc_ids': run.doc_ids}
+
+
+def load_queries(pathname, query_offset=0, cache=True):
+    """ Returns the queries contained in the target pathname tsv file
+
+    :param pathname: string
+        tsv file with header and rows "query_id query"
+    :param query_offset: int
+        added to every query id, e.g. -1 to start counting from 0
+    :param cache: bool
+        if True the parsed columns are cached next to the file, see cached_arrays()
+    :return: dictionary {query_id: string}
+    """
+    columns = cached_arrays(pathname, 'queries', parse_queries) if cache else parse_queries(pathname)
+
+    return dict(zip((columns['query_ids'] + query_offset).tolist(), columns['queries'].tolist()))
+
+
+def load_ground_truth(pathname, query_offset=0, cache=True):
+    """ Returns the relevant documents of each query
+
+    :param pathname: string
+        tsv file with header and rows "query_id doc_id"
+    :param query_offset: int
+        added to every query id, e.g. -1 to start counting from 0
+    :param cache: bool
+        if True the parsed columns are cached next to the file, see cached_arrays()
+    :return: Qrels object
+    """
+    columns = cached_arrays(pathname, 'qrels', parse_pairs) if cache else parse_pairs(pathname)
+
+    return Qrels(columns['query_ids'] + query_offset, columns['offsets'], columns['doc_ids'])
+
+
+def load_run(pathname, cache=True):
+    """ Returns the results of a search engine sorted by rank
+
+    :param pathname: string
+        tsv file with header and rows "query_id doc_id rank"
+    :param cache: bool
+        if True the parsed columns are cached next to the file, see cached_arrays()
+    :return: Run object
+    """
+    columns = cached_arrays(pathname, 'run', parse_run) if cache else parse_run(pathname)
+
+    return Run(columns['query_ids'], columns['offsets'], columns['doc_ids'])
@@ -0,0 +1,172 @@
+import numpy as np
+
+
+def relevance_matrix(run, qrels, depth=None):
+    """ Returns the binary relevance of the results of every query of run
+
+    :param run: Run object
+    :param qrels: Qrels object
+    :param depth: int
+        minimum number of columns, results shorter than the depth are
+        padded with non relevant documents
+    :return: pair (rel, n_rel)
+        rel is a boolean numpy array Q x D where rel[q, i] is True if the document
+        at rank i + 1 of run.query_ids[q] is relevant, n_rel the number of
+        relevant documents of each query (0 if it has no ground truth)
+    """
+    lengths = run.lengths()
+    width = max(int(lengths.max(initial=0)), depth or 1)
+
+    # row of each run query in qrels and of each document in run
+    qrels_rows = qrels.rows(run.query_ids)
+    doc_rows = np.repeat(qrels_rows, lengths)
+
+    # (query, document) pairs encoded as a single int, so that the relevance
+    # of all the results is found with a single np.isin
+    base = int(max(run.doc_ids.max(initial=0), qrels.doc_ids.max(initial=0))) + 1
+    qrels_keys = np.repeat(np.arange(len(qrels)), qrels.lengths()) * base + qrels.doc_ids
+    run_keys = np.where(doc_rows >= 0, doc_rows * base + run.doc_ids, -1)
+
+    rel = np.zeros((len(run), width), dtype=bool)
+    ranks = np.arange(len(run.doc_ids)) - np.repeat(run.offsets[:-1], lengths)
+    rel[np.repeat(np.arange(len(run)), lengths), ranks] = np.isin(run_keys, qrels_keys)
+
+    n_rel = np.where(qrels_rows >= 0, qrels.lengths()[qrels_rows], 0)
+
+    return rel, n_rel
+
+
+def hits_at(rel, cutoff):
+    """ Returns the number of relevant documents in the first cutoff ranks
+
+    :param rel: numpy array Q x D of bools
+    :param cutoff: int or numpy array of Q ints
+    :return: numpy array of Q ints
+    """
+    hits = np.cumsum(rel, axis=1)
+    cutoff = np.broadcast_to(cutoff, (len(rel),))
+
+    # cutoffs beyond the results count all of them, a cutoff of 0 counts none
+    found = hits[np.arange(len(rel)), np.clip(cutoff, 1, rel.shape[1]) - 1]
+    return np.where(cutoff > 0, found, 0)
+
+
+def vectorized_metrics(rel, n_rel, k_values):
+    """ Computes all the metrics of the queries at once from their relevance matrix
+
+    :param rel: numpy array Q x D of bools
+        output of relevance_matrix()
+    :param n_rel: numpy array of Q ints
+        output of relevance_matrix()
+    :param k_values: list of ints
+        each k must be <= D
+    :return: dictionary
+        'MRR' is a float, 'reciprocal_rank' and 'r_precision' are arrays of Q
+        values, 'precision', 'recall' and 'ndcg' are dictionaries {k: array of Q values}
+    """
+    # number of relevant documents in the first i + 1 ranks
+    hits = np.cumsum(rel, axis=1)
+
+    # rank of the first relevant document, 0 if there is none
+    reciprocal_rank = np.where(rel.any(axis=1), 1 / (rel.argmax(axis=1) + 1), 0)
+
+    # R-precision: relevant documents in the first R ranks over R
+    r_precision = hits_at(rel, n_rel) / np.maximum(n_rel, 1)
+
+    # discount of rank i + 1 is log2(i + 1), with the first two ranks not discounted
+    discount = 1 / np.log2(np.maximum(np.arange(1, rel.shape[1] + 1), 2))
+    dcg = np.cumsum(rel * discount, axis=1)
+    ideal = np.cumsum(discount)
+
+    return {'MRR': reciprocal_rank.mean(),
+            'reciprocal_rank': reciprocal_rank,
+            'r_precision': r_precision,
+            'precision': {k: hits[:, k - 1] / k for k in k_values},
+            'recall': {k: hits[:, k - 1] / np.maximum(n_rel, 1) for k in k_values},
+            'ndcg': {k: dcg[:, k - 1] / ideal[k - 1] for k in k_values}}
+
+
+def precision_at_k(run, qrels, k=None, clamp_k=False):
+    """ Returns the precision at k of each query of run
+
+    :param run: Run object
+    :param qrels: Qrels object
+    :param k: int
+        if None k is the number of relevant documents of the query (R-precision)
+    :param clamp_k: bool
+        if True k is lowered to the number of relevant documents of the query
+    :return: numpy array of floats, aligned with run.query_ids
+    """
+    rel, n_rel = relevance_matrix(run, qrels, k)
+    cutoff = n_rel if k is None else np.full(len(run), k)
+
+    if clamp_k:
+        cutoff = np.minimum(cutoff, n_rel)
+
+    return hits_at(rel, cutoff) / np.maximum(cutoff, 1)
+
+
+def recall_at_k(run, qrels, k=None, clamp_k=False):
+    """ Returns the recall at k of each query of run
+
+    :param run: Run object
+    :param qrels: Qrels object
+    :param k: int
+        if None all the documents returned are considered
+    :param clamp_k: bool
+        if True k is lowered to the number of relevant documents of the query
+    :return: numpy array of floats, aligned with run.query_ids
+    """
+    rel, n_rel = relevance_matrix(run, qrels, k)
+    cutoff = run.lengths() if k is None else np.full(len(run), k)
+
+    if clamp_k:
+        cutoff = np.minimum(cutoff, n_rel)
+
+    return hits_at(rel, cutoff) / np.maximum(n_rel, 1)
+
+
+def f_beta(precision, recall, beta=1.0, zero_division=0.0):
+    """ Returns the F-beta score of aligned precision and recall values
+
+    :param precision: numpy array of floats
+    :param recall: numpy array of floats
+        same shape as precision
+    :param beta: float or numpy array of floats
+        weight of recall, broadcasted against precision: an array of shape
+        (B, 1) computes B scores for each value at once
+    :param zero_division: float
+        value returned where precision and recall are both 0
+    :return: numpy array of floats
+    """
+    precision = np.asarray(precision, dtype=float)
+    recall = np.asarray(recall, dtype=float)
+    beta2 = np.asarray(beta, dtype=float) ** 2
+
+    numerator = (1 + beta2) * precision * recall
+    denominator = beta2 * precision + recall
+    shape = np.broadcast(numerator, denominator).shape
+
+    return np.divide(np.broadcast_to(numerator, shape), np.broadcast_to(denominator, shape),
+                     out=np.full(shape, zero_division, dtype=float), where=denominator > 0)
+
+
+def compute_stats(values):
+    """ Return a dictionary of aggregate stats on values
+
+    :param values: numpy array of floats or dictionary {query_id: float}
+    :return: dictionary {string: float}
+    """
+    if isinstance(values, dict):
+        values = list(values.values())
+
+    vals = np.asarray(values, dtype=float)
+
+    stats = {'min': np.min(vals),
+             'max': np.max(vals),
+             'mean': np.mean(vals),
+             'median': np.median(vals),
+             'first_quartile': np.quantile(vals, 0.25),
+             'third_quartile': np.quantile(vals, 0.75)}
+
+    return stats
@@ -0,0 +1,134 @@
+from itertools import combinations
+import numpy as np
+
+# resamples drawn at once, bounds the memory used to chunk x Q floats
+CHUNK_SIZE = 1000
+
+
+def paired_differences(scores):
+    """ Returns the per query differences of every pair of engines
+
+    :param scores: numpy array E x Q
+        score of each of the E engines on each of the Q queries
+    :return: pair (pairs, diffs)
+        pairs is the list of the E * (E - 1) / 2 pairs (i, j) of engines,
+        diffs the numpy array pairs x Q of scores[i] - scores[j]
+    """
+    scores = np.asarray(scores, dtype=float)
+    pairs = list(combinations(range(len(scores)), 2))
+    first, second = np.array(pairs, dtype=int).reshape(-1, 2).T
+
+    return pairs, scores[first] - scores[second]
+
+
+def permutation_test(scores, n_permutations=10000, seed=None, chunk_size=CHUNK_SIZE):
+    """ Paired randomization test of the mean difference of every pair of engines
+
+        Under the null hypothesis the two scores of a query are exchangeable,
+        so each permutation flips the sign of the difference of a random subset
+        of the queries. The same sign flips are used for all the pairs, so that
+        a chunk of permutations of all the pairs is a single matrix product.
+
+    :param scores: numpy array E x Q
+        score of each of the E engines on each of the Q queries
+    :param n_permutations: int
+    :param seed: int
+        seed of the random generator, the p-values are reproducible
+    :param chunk_size: int
+        permutations drawn at once
+    :return: pair (pairs, p_values)
+        pairs as returned by paired_differences(), p_values the numpy array
+        of the two-sided p-value of each pair
+    """
+    rng = np.random.default_rng(seed)
+    pairs, diffs = paired_differences(scores)
+    n_queries = diffs.shape[1]
+
+    observed = np.abs(diffs.mean(axis=1))
+    extreme = np.zeros(len(pairs), dtype=np.int64)
+
+    for start in range(0, n_permutations, chunk_size):
+        size = min(chunk_size, n_permutations - start)
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(size, n_queries))
+
+        # size x pairs mean differences of the permuted scores
+        permuted = np.abs(signs @ diffs.T) / n_queries
+        extreme += (permuted >= observed - 1e-12).sum(axis=0)
+
+    # the observed assignment counts as one of the permutations
+    return pairs, (extreme + 1) / (n_permutations + 1)
+
+
+def holm_correction(p_values):
+    """ Adjusts the p-values of multiple comparisons with the Holm-Bonferroni method
+
+    :param p_values: numpy array of floats
+    :return: numpy array of the adjusted p-values, in the same order
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    order = np.argsort(p_values)
+    n = len(p_values)
+
+    # step-down: the i-th smallest p-value is multiplied by n - i, then made monotone
+    adjusted = np.maximum.accumulate(p_values[order] * (n - np.arange(n)))
+
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+
+def bootstrap_ci(scores, n_resamples=10000, alpha=0.05, seed=None, chunk_size=CHUNK_SIZE):
+    """ Percentile bootstrap confidence interval of the mean score of every engine
+
+        Each resample draws the queries with replacement, as the counts of a
+        multinomial, so the means of a chunk of resamples of all the engines
+        are a single matrix product. All the engines share the same resamples.
+
+    :param scores: numpy array E x Q
+        score of each of the E engines on each of the Q queries
+    :param n_resamples: int
+    :param alpha: float
+        the interval has confidence 1 - alpha
+    :param seed: int
+        seed of the random generator, the intervals are reproducible
+    :param chunk_size: int
+        resamples drawn at once
+    :return: numpy array E x 3
+        mean, lower and upper bound of the interval of each engine
+    """
+    rng = np.random.default_rng(seed)
+    scores = np.asarray(scores, dtype=float)
+    n_queries = scores.shape[1]
+
+    means = np.empty((n_resamples, len(scores)))
+
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        counts = rng.multinomial(n_queries, np.full(n_queries, 1 / n_queries), size=size)
+        means[start:start + size] = counts @ scores.T / n_queries
+
+    low, high = np.quantile(means, [alpha / 2, 1 - alpha / 2], axis=0)
+
+    return np.column_stack([scores.mean(axis=1), low, high])
+
+
+def compare_engines(scores, n_resamples=10000, alpha=0.05, seed=None):
+    """ Compares N engines on one metric: bootstrap intervals of every engine
+        and permutation tests of every pair, corrected for multiple comparisons
+
+    :param scores: numpy array E x Q
+        score of each of the E engines on each of the Q queries
+    :param n_resamples: int
+        number of bootstrap resamples and of permutations
+    :param alpha: float
+    :param seed: int
+    :return: dictionary
+        'ci' is the output of bootstrap_ci(), 'pairs' the list of pairs of
+        engines, 'p_values' and 'adjusted' their raw and Holm corrected p-values
+    """
+    pairs, p_values = permutation_test(scores, n_resamples, seed)
+
+    return {'ci': bootstrap_ci(scores, n_resamples, alpha, seed),
+            'pairs': pairs,
+            'p_values': p_values,
+            'adjusted': holm_correction(p_values)}
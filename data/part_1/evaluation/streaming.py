@@ -0,0 +1,138 @@
+from itertools import islice
+import numpy as np
+import csv
+
+# rows of a run file read at once
+CHUNK_SIZE = 100000
+
+
+def read_run_chunks(pathname, chunk_size=CHUNK_SIZE):
+    """ Yields the rows of a run file in chunks, never reading it whole
+
+    :param pathname: string
+        tsv file with header and rows "query_id doc_id rank"
+    :param chunk_size: int
+    :return: generator of numpy arrays chunk_size x 3 of ints
+    """
+    with open(pathname) as csvfile:
+        reader = csv.reader(csvfile, delimiter='\t')
+
+        # skip header
+        next(reader, None)
+
+        while True:
+            rows = list(islice(reader, chunk_size))
+
+            if len(rows) == 0:
+                return
+
+            yield np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+
+def stream_top_k(pathname, k, grouped=False, chunk_size=CHUNK_SIZE):
+    """ Yields the k best ranked documents of each query of a run file,
+        keeping in memory only k documents per open query
+
+    :param pathname: string
+        tsv file with header and rows "query_id doc_id rank"
+    :param k: int
+    :param grouped: bool
+        if True the rows of a query are assumed contiguous in the file, so a
+        query is yielded (and forgotten) as soon as the next one starts
+    :param chunk_size: int
+    :return: generator of pairs (query_id, numpy array of at most k doc ids sorted by rank)
+    """
+    top = {}
+
+    for chunk in read_run_chunks(pathname, chunk_size):
+        # the last query of the chunk may continue in the next one
+        last = chunk[-1, 0]
+
+        # sort by query and rank, then keep the first k rows of each query
+        chunk = chunk[np.lexsort((chunk[:, 2], chunk[:, 0]))]
+        queries, starts = np.unique(chunk[:, 0], return_index=True)
+        ends = np.append(starts[1:], len(chunk))
+
+        for query_id, start, end in zip(queries.tolist(), starts, ends):
+            ranks, docs = chunk[start:end, 2][:k], chunk[start:end, 1][:k]
+
+            if query_id in top:
+                # merge with the best documents of the previous chunks
+                ranks = np.concatenate([top[query_id][0], ranks])
+                docs = np.concatenate([top[query_id][1], docs])
+                best = np.argsort(ranks, kind="stable")[:k]
+                ranks, docs = ranks[best], docs[best]
+
+            top[query_id] = (ranks, docs)
+
+        if grouped:
+            for query_id in [q for q in top if q != last]:
+                yield query_id, top.pop(query_id)[1]
+
+    for query_id, (_, docs) in top.items():
+        yield query_id, docs
+
+
+class StreamingEvaluator(object):
+    def __init__(self, qrels, k, clamp_k=False):
+        """ Computes precision and recall at k one query at a time
+
+        :param qrels: Qrels object
+        :param k: int
+        :param clamp_k: bool
+            if True k is lowered to the number of relevant documents of the query
+        """
+        self.k = k
+        self.clamp_k = clamp_k
+        self.query_ids = qrels.query_ids
+        self.relevant = {query_id: set(docs) for query_id, docs in qrels.to_dict().items()}
+        self.rows = {query_id: i for i, query_id in enumerate(self.query_ids.tolist())}
+
+        # queries without results keep 0, as in evaluation.precision_at_k
+        self.precision = np.zeros(len(qrels))
+        self.recall = np.zeros(len(qrels))
+        self.seen = np.zeros(len(qrels), dtype=bool)
+
+    def update(self, query_id, docs):
+        """ Adds the results of a query, queries without ground truth are ignored
+
+        :param query_id: int
+        :param docs: list of doc ids sorted by rank
+        """
+        row = self.rows.get(query_id)
+
+        if row is None:
+            return
+
+        if self.seen[row]:
+            raise ValueError(f"Query {query_id} seen twice, is the run file grouped by query?")
+
+        gt = self.relevant[query_id]
+        cutoff = min(self.k, len(gt)) if self.clamp_k else self.k
+        hits = sum(doc_id in gt for doc_id in docs[:cutoff])
+
+        self.precision[row] = hits / max(cutoff, 1)
+        self.recall[row] = hits / max(len(gt), 1)
+        self.seen[row] = True
+
+
+def evaluate_run_file(pathname, qrels, k, clamp_k=False, grouped=False, chunk_size=CHUNK_SIZE):
+    """ Streams a run file and returns its precision and recall at k
+
+    :param pathname: string
+        tsv file with header and rows "query_id doc_id rank"
+    :param qrels: Qrels object
+    :param k: int
+    :param clamp_k: bool
+    :param grouped: bool
+        see stream_top_k()
+    :param chunk_size: int
+    :return: StreamingEvaluator object
+        its precision and recall arrays are aligned with qrels.query_ids
+    """
+    evaluator = StreamingEvaluator(qrels, k, clamp_k)
+
+    for query_id, docs in stream_top_k(pathname, k, grouped, chunk_size):
+        evaluator.update(query_id, docs.tolist())
+
+    return evaluator
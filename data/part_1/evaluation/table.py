@@ -0,0 +1,136 @@
+from .metrics import f_beta
+import numpy as np
+import csv
+
+
+class MetricTable(object):
+    def __init__(self, query_ids):
+        """ Per query metrics of several engines, aligned on the same queries:
+            one row per query and one column per (metric, engine) pair
+
+        :param query_ids: numpy array of Q ints
+        """
+        self.query_ids = np.asarray(query_ids, dtype=np.int64)
+        self.columns = {}
+
+    def add(self, metric, engine, values):
+        """ Adds the column of a metric of an engine
+
+        :param metric: string
+        :param engine: string
+        :param values: numpy array of Q floats, aligned with query_ids
+        :return: None
+        """
+        values = np.asarray(values, dtype=float)
+
+        if values.shape != self.query_ids.shape:
+            raise ValueError(f"{metric} of {engine} has {len(values)} values, "
+                             f"the table has {len(self.query_ids)} queries")
+
+        self.columns[(metric, engine)] = values
+
+    def metrics(self):
+        """ Returns the metrics of the table, in insertion order """
+        return list(dict.fromkeys(metric for metric, _ in self.columns))
+
+    def engines(self):
+        """ Returns the engines of the table, in insertion order """
+        return list(dict.fromkeys(engine for _, engine in self.columns))
+
+    def matrix(self, metric, engines=None):
+        """ Returns the values of a metric as a numpy array E x Q
+
+        :param metric: string
+        :param engines: list of strings
+            if None all the engines of the table
+        :return: numpy array of floats
+        """
+        engines = self.engines() if engines is None else engines
+        return np.array([self.columns[(metric, engine)] for engine in engines]).reshape(len(engines), -1)
+
+    def mean(self, metric):
+        """ Returns the mean of a metric over the queries for each engine
+
+        :param metric: string
+        :return: dictionary {engine: float}
+        """
+        return {engine: values.mean() for (m, engine), values in self.columns.items() if m == metric}
+
+    def add_fbeta(self, beta=1.0, zero_division=0.0, precision="precision", recall="recall"):
+        """ Adds the F-beta score of every engine that has both precision and
+            recall, computed for all of them in a single pass
+
+        :param beta: float
+        :param zero_division: float
+            score of the queries where precision and recall are both 0
+        :param precision: string
+            name of the precision metric
+        :param recall: string
+            name of the recall metric
+        :return: string
+            name of the added metric
+        """
+        engines = [e for e in self.engines() if (precision, e) in self.columns and (recall, e) in self.columns]
+        scores = f_beta(self.matrix(precision, engines), self.matrix(recall, engines), beta, zero_division)
+
+        name = f"f{beta:g}"
+        for engine, values in zip(engines, scores):
+            self.add(name, engine, values)
+
+        return name
+
+    def to_csv(self, pathname):
+        """ Writes the table to a csv file, with header
+            "query_id metric:engine metric:engine ..."
+
+        :param pathname: string
+        :return: None
+        """
+        keys = list(self.columns.keys())
+        values = np.column_stack([self.columns[k] for k in keys]) if keys else np.empty((len(self.query_ids), 0))
+
+        with open(pathname, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["query_id"] + [f"{metric}:{engine}" for metric, engine in keys])
+            writer.writerows([q] + row for q, row in zip(self.query_ids.tolist(), values.tolist()))
+
+    @classmethod
+    def read_csv(cls, pathname):
+        """ Reads a table written by to_csv()
+
+        :param pathname: string
+        :return: MetricTable object
+        """
+        with open(pathname, newline="") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            rows = np.array(list(reader), dtype=float).reshape(-1, len(header))
+
+        table = cls(rows[:, 0].astype(np.int64))
+        for j, name in enumerate(header[1:], start=1):
+            metric, engine = name.split(":", 1)
+            table.add(metric, engine, rows[:, j])
+
+        return table
+
+    def to_pandas(self):
+        """ Returns the table as a pandas DataFrame indexed by query_id,
+            with (metric, engine) MultiIndex columns. Requires pandas """
+        import pandas as pd
+
+        frame = pd.DataFrame(self.columns, index=pd.Index(self.query_ids, name="query_id"))
+        frame.columns = pd.MultiIndex.from_tuples(self.columns.keys(), names=["metric", "engine"])
+
+        return frame
+
+    def to_parquet(self, pathname):
+        """ Writes the table to a parquet file. Requires pandas and pyarrow
+
+        :param pathname: string
+        :return: None
+        """
+        frame = self.to_pandas()
+
+        # parquet column names must be strings
+        frame.columns = [f"{metric}:{engine}" for metric, engine in frame.columns]
+        frame.to_parquet(pathname)
@@ -1,9 +1,17 @@
 from whoosh.fields import Schema, TEXT, ID
 from whoosh.index import create_in
+from whoosh.writing import SegmentWriter, MERGE_SMALL, OPTIMIZE
+from whoosh.reading import SegmentReader
 from whoosh import index
+from multiprocessing import Pool
+from time import perf_counter
+import hashlib
+import json
 import os
 from config import *
-from bs4 import BeautifulSoup
+from extractors import EXTRACTORS, read_html, validate_extractors
+
+MANIFEST_FILENAME = "manifest.json"
 
 
 def id_from_filename(pathname):
@@ -34,21 +42,222 @@ def get_schema(dataset, analyzer):
     :return: Schema object
     """
     if dataset == 'cranfield':
-        custom_schema = Schema(id=ID(stored=True), title=TEXT(stored=False, analyzer=analyzer),
+        custom_schema = Schema(id=ID(stored=True, unique=True), title=TEXT(stored=False, analyzer=analyzer),
                                content=TEXT(stored=False, analyzer=analyzer))
     else:
-        custom_schema = Schema(id=ID(stored=True),
+        custom_schema = Schema(id=ID(stored=True, unique=True),
                                content=TEXT(stored=False, analyzer=analyzer))
 
     return custom_schema
 
 
-if __name__ == "__main__":
-    # inputs from command line
-    config = build_index_config()
-    analyzer_str = config['analyzer']
-    dataset_str = config['dataset']
+def parse_document(pathname, extractor='bs4'):
+    """ Read the html file at pathname and return its id and text fields
+
+    :param pathname: string
+    :param extractor: string
+        a key of EXTRACTORS
+    :return: pair (doc_id, fields)
+        fields is a dictionary {'title': string, 'content': string}
+    """
+    html = read_html(pathname)
+
+    return id_from_filename(pathname), EXTRACTORS[extractor](html)
+
+
+def write_documents(writers, documents):
+    """ Writes each parsed document to the writers of the indexes it belongs to
+
+    :param writers: dictionary {analyzer_str: (writer, fields)}
+        fields are the text fields of the schema of the index
+    :param documents: iterable of tuples (doc_id, fields, targets)
+        targets is a dictionary {analyzer_str: bool}, True if the document
+        replaces a previous version of itself
+    """
+    for doc_id, fields, targets in documents:
+        for analyzer_str, update in targets.items():
+            writer, names = writers[analyzer_str]
+
+            # all the fields of the schema are written in the same pass
+            doc = {name: fields[name] for name in names}
+
+            if update:
+                # replace the previous version of the document
+                writer.update_document(id=doc_id, **doc)
+            else:
+                # add document to index
+                writer.add_document(id=doc_id, **doc)
+
+
+def index_chunk(job):
+    """ Parses a chunk of documents once and writes them to a new segment of
+        each index, like the sub-writers of whoosh's MpWriter with multisegment
+
+    :param job: tuple (chunk, indexes, extractor, limitmb)
+        chunk is a list of pairs (pathname, targets), see write_documents(),
+        indexes a dictionary {analyzer_str: (index_dir, fields)}
+    :return: dictionary {analyzer_str: Segment}
+        segments written but not committed, see commit_segments()
+    """
+    chunk, indexes, extractor, limitmb = job
+    writers = {}
+
+    for analyzer_str in set(a for _, targets in chunk for a in targets):
+        index_dir, fields = indexes[analyzer_str]
+
+        # no lock: the main process holds it, see build_parallel()
+        writers[analyzer_str] = (SegmentWriter(index.open_dir(index_dir), _lk=False, limitmb=limitmb), fields)
+
+    # the previous versions of the documents are deleted by commit_segments()
+    write_documents(writers, ((*parse_document(pathname, extractor), dict.fromkeys(targets, False))
+                              for pathname, targets in chunk))
+
+    # the temporary files of the index are removed by commit_segments()
+    return {analyzer_str: writer._finalize_segment() for analyzer_str, (writer, _) in writers.items()}
+
+
+def commit_segments(index_dir, segments, deleted, optimize=False, limitmb=128):
+    """ Adds the segments written by index_chunk() to the index in index_dir,
+        whose lock is held by the caller
+
+    :param index_dir: string
+    :param segments: list of Segment objects
+        documents are numbered in this order, after the existing ones
+    :param deleted: list of strings
+        ids of the documents removed from the corpus or replaced by the segments
+    :param optimize: bool
+        if True all the segments are merged into one
+    :param limitmb: int
+    """
+    writer = SegmentWriter(index.open_dir(index_dir), _lk=False, limitmb=limitmb)
 
+    for doc_id in deleted:
+        writer.delete_by_term('id', doc_id)
+
+    def add_segments(writer, existing):
+        # merging copies every posting again, the new segments are kept as
+        # they are unless the index is optimized
+        if not optimize:
+            return MERGE_SMALL(writer, existing) + segments
+
+        merged = OPTIMIZE(writer, existing)
+
+        for segment in segments:
+            with SegmentReader(writer.storage, writer.schema, segment) as reader:
+                add_part(writer, reader)
+
+        return merged
+
+    writer.commit(mergetype=add_segments)
+
+
+def add_part(writer, reader):
+    """ Adds the documents of reader to writer keeping the exact total length
+        of each field, the average field length used by BM25F
+
+    :param writer: Whoosh SegmentWriter
+    :param reader: Whoosh IndexReader
+        of a segment without deleted documents
+    """
+    # add_reader() sums the lengths of the documents as quantized to a byte,
+    # while add_document() sums the exact ones
+    totals = writer.perdocwriter._fieldlengths
+    expected = {name: totals[name] + reader.field_length(name) for name in reader.indexed_field_names()}
+
+    writer.add_reader(reader)
+
+    for name, length in expected.items():
+        if length:
+            totals[name] = length
+
+
+def content_hash(pathname):
+    """ Return the md5 digest of the content of pathname
+
+    :param pathname: string
+    :return: string
+    """
+    with open(pathname, "rb") as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+def load_manifest(index_dir):
+    """ Return the manifest of the documents indexed in index_dir
+
+    :param index_dir: string
+    :return: dictionary {doc_id: [mtime, content hash]}
+        empty if the index has no manifest
+    """
+    pathname = os.path.join(index_dir, MANIFEST_FILENAME)
+
+    if not os.path.exists(pathname):
+        return {}
+
+    with open(pathname, "r") as file:
+        return json.load(file)
+
+
+def save_manifest(index_dir, manifest):
+    """ Write the manifest of the documents indexed in index_dir
+
+    :param index_dir: string
+    :param manifest: dictionary {doc_id: [mtime, content hash]}
+    """
+    with open(os.path.join(index_dir, MANIFEST_FILENAME), "w") as file:
+        json.dump(manifest, file)
+
+
+def diff_manifest(manifest, files):
+    """ Compare the files in the corpus against the manifest of the index
+
+    :param manifest: dictionary {doc_id: [mtime, content hash]}
+        output of load_manifest()
+    :param files: list of strings
+    :return: tuple (added, changed, removed, new_manifest)
+        added and changed are lists of pathnames, removed is a list of doc_ids
+        and new_manifest is the manifest describing the corpus
+    """
+    added, changed = [], []
+    new_manifest = {}
+
+    for pathname in files:
+        doc_id = id_from_filename(pathname)
+        mtime = os.path.getmtime(pathname)
+        entry = manifest.get(doc_id)
+
+        # same mtime, no need to read the file
+        if entry is not None and entry[0] == mtime:
+            new_manifest[doc_id] = entry
+            continue
+
+        digest = content_hash(pathname)
+        new_manifest[doc_id] = [mtime, digest]
+
+        if entry is None:
+            added.append(pathname)
+        elif entry[1] != digest:
+            changed.append(pathname)
+
+    removed = [doc_id for doc_id in manifest if doc_id not in new_manifest]
+
+    return added, changed, removed, new_manifest
+
+
+def prepare_index(dataset_str, analyzer_str, files, config):
+    """ Open (or create) the index of dataset_str built with analyzer_str and
+        return it together with the documents that need to be indexed
+
+    :param dataset_str: string
+    :param analyzer_str: string
+        a key of ANALYZERS
+    :param files: list of strings
+        pathnames of all the documents in the corpus
+    :param config: dictionary
+        output of build_index_config()
+    :return: dictionary with keys 'dir', 'fields', 'added', 'changed', 'removed', 'manifest'
+        fields are the text fields of the schema, added and changed are sets
+        of pathnames still to be written, removed the ids to delete
+    """
     # index target directory and analyzer
     index_dir = f"{INDEX_PATH}_{dataset_str}_{analyzer_str}"
     analyzer = ANALYZERS[analyzer_str]
@@ -61,26 +270,143 @@ if __name__ == "__main__":
     # get schema based on selected dataset
     schema = get_schema(dataset_str, analyzer)
 
-    # create index
-    create_in(index_dir, schema)
-    ix = index.open_dir(index_dir)
-    writer = ix.writer()
+    # only re-index what changed since the last run, if there was one
+    manifest = load_manifest(index_dir)
+    incremental = config['incremental'] and index.exists_in(index_dir) and len(manifest) > 0
+
+    if not incremental:
+        # create index
+        create_in(index_dir, schema)
+        manifest = {}
+
+    added, changed, removed, manifest = diff_manifest(manifest, files)
+    print(f"Added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}")
+
+    # text fields declared by the schema, e.g. cranfield also has a title
+    fields = [name for name in schema.names() if name != 'id']
+
+    return {'dir': index_dir, 'fields': fields, 'added': set(added), 'changed': set(changed),
+            'removed': removed, 'manifest': manifest}
+
+
+def build_serial(targets, files, extractor='bs4', limitmb=128, optimize=False):
+    """ Parses and indexes the documents in the main process, one writer per index
+
+    :param targets: dictionary {analyzer_str: output of prepare_index()}
+    :param files: list of pairs (pathname, targets)
+        documents to index, see write_documents()
+    :param extractor: string
+    :param limitmb: int
+    :param optimize: bool
+    """
+    writers = {}
+
+    for analyzer_str, target in targets.items():
+        writer = index.open_dir(target['dir']).writer(limitmb=limitmb)
+
+        for doc_id in target['removed']:
+            writer.delete_by_term('id', doc_id)
+
+        writers[analyzer_str] = (writer, target['fields'])
+
+    write_documents(writers, ((*parse_document(pathname, extractor), document_targets)
+                              for pathname, document_targets in files))
+
+    for writer, _ in writers.values():
+        writer.commit(optimize=optimize)
+
+
+def build_parallel(targets, files, procs, extractor='bs4', limitmb=128, optimize=False):
+    """ Parses and indexes the documents in a pool of procs processes: each
+        one parses a chunk of documents once and writes a segment of every
+        index, then each index commits its segments, in the order of files,
+        in its own process. Whoosh sums
+        the scores of a segment in its own order, so documents with the same
+        score may swap places: optimize merges the segments into the one
+        build_serial() writes
+
+    :param targets: dictionary {analyzer_str: output of prepare_index()}
+    :param files: list of pairs (pathname, targets)
+        documents to index, see write_documents()
+    :param procs: int
+    :param extractor: string
+    :param limitmb: int
+        memory of each writer
+    :param optimize: bool
+    """
+    # one chunk, so one segment per index, for each process
+    chunk_size = max(1, -(-len(files) // procs))
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    indexes = {analyzer_str: (target['dir'], target['fields']) for analyzer_str, target in targets.items()}
+
+    # the indexes are locked until the segments are committed, as MpWriter does
+    locks = [index.open_dir(target['dir']).lock("WRITELOCK") for target in targets.values()]
+
+    for target, lock in zip(targets.values(), locks):
+        if not lock.acquire():
+            raise index.LockError(f"Index {target['dir']} is locked by another writer")
+
+    try:
+        with Pool(procs) as pool:
+            results = pool.map(index_chunk, [(chunk, indexes, extractor, limitmb) for chunk in chunks], chunksize=1)
+
+        jobs = []
+
+        for analyzer_str, target in targets.items():
+            # replaced documents are deleted then added again, like update_document()
+            deleted = target['removed'] + [id_from_filename(f) for f in target['changed']]
+            segments = [result[analyzer_str] for result in results if analyzer_str in result]
+
+            jobs.append((target['dir'], segments, deleted, optimize, limitmb))
+
+        # one writer process per index, the merges of optimize run side by side
+        with Pool(min(procs, len(jobs))) as pool:
+            pool.starmap(commit_segments, jobs, chunksize=1)
+    finally:
+        for lock in locks:
+            lock.release()
+
+
+if __name__ == "__main__":
+    # inputs from command line
+    config = build_index_config()
+    dataset_str = config['dataset']
+    procs = config['procs']
+
+    # 'all' writes every analyzer's index in the same pass over the corpus
+    if config['analyzer'] == 'all':
+        analyzers = list(ANALYZERS.keys())
+    else:
+        analyzers = [config['analyzer']]
 
     # list of documents to be indexed
     files = pathnames_from_dir(DATASETS[dataset_str]['dir'])
 
-    for pathname in files:
-        # read html content
-        with open(pathname, "r") as file:
-            html = file.read()
+    # make sure the selected extractor agrees with BeautifulSoup on a sample
+    if config['validate'] > 0:
+        mismatches = validate_extractors(files, config['validate'], candidate=config['extractor'])
+        if len(mismatches) > 0:
+            raise SystemExit(f"Extractor '{config['extractor']}' differs from 'bs4' on {mismatches}")
+        print(f"Extractor '{config['extractor']}' validated on {min(config['validate'], len(files))} documents")
 
-        soup = BeautifulSoup(html, "html.parser")
+    tic = perf_counter()
 
-        # add document to index
-        doc_id = id_from_filename(pathname)
-        content = soup.body.string.strip()
-        writer.add_document(id=doc_id, content=content)
+    targets = {analyzer_str: prepare_index(dataset_str, analyzer_str, files, config) for analyzer_str in analyzers}
+
+    # each document is read and parsed once, whatever the number of indexes,
+    # and mapped to the indexes missing it (True if it replaces an older version)
+    to_index = [(f, {a: f in t['changed'] for a, t in targets.items() if f in t['added'] or f in t['changed']})
+                for f in files]
+    to_index = [(f, document_targets) for f, document_targets in to_index if len(document_targets) > 0]
+
+    if procs > 1:
+        build_parallel(targets, to_index, procs, config['extractor'], config['limitmb'], config['optimize'])
+    else:
+        build_serial(targets, to_index, config['extractor'], config['limitmb'], config['optimize'])
 
-    writer.commit()
+    for target in targets.values():
+        save_manifest(target['dir'], target['manifest'])
 
-    print(f"Indexed {len(files)} documents")
+    elapsed = perf_counter() - tic
+    print(f"Indexed {len(to_index)} documents in {len(targets)} indexes in {elapsed:.2f} seconds "
+          f"({len(to_index) / elapsed:.1f} docs/sec, procs={procs})")
@@ -1,17 +1,24 @@
 import argparse
 from whoosh import scoring
 from whoosh.analysis import *
-from utils import load_queries, load_ground_truth, queries_with_gt
+from utils import load_queries, load_ground_truth, queries_with_gt, DEFAULT_LIMIT
 
 
 INDEX_PATH = "./data/index"
+CACHE_DIR = "./cache"
 
+# bump whenever the search results or the fields of Metrics change, so older cached pickles are not reused
+METRICS_VERSION = 3
+
+# 'fields' are the searched fields with their boost
 DATASETS = {'cranfield': {'dir': "../Cranfield_DATASET/DOCUMENTS/",
                           'query': "../Cranfield_DATASET/cran_Queries.tsv",
-                          'gt': "../Cranfield_DATASET/cran_Ground_Truth.tsv"},
+                          'gt': "../Cranfield_DATASET/cran_Ground_Truth.tsv",
+                          'fields': {'title': 2.0, 'content': 1.0}},
             'time': {'dir': "../Time_DATASET/DOCUMENTS/",
                      'query': "../Time_DATASET/time_Queries.tsv",
-                     'gt': "../Time_DATASET/time_Ground_Truth.tsv"}}
+                     'gt': "../Time_DATASET/time_Ground_Truth.tsv",
+                     'fields': {'content': 1.0}}}
 
 ANALYZERS = {'simple': SimpleAnalyzer(),
              'standard': StandardAnalyzer(),
@@ -55,11 +62,28 @@ def query_config():
                         help="Choose among ['cranfield', 'time']")
     parser.add_argument('-B', type=float, default=0.75, help="See BM25F documentation")
     parser.add_argument('-K1', type=float, default=1.2, help="See BM25F documentation")
+    parser.add_argument('-p', '--procs', type=int, default=1,
+                        help="Number of processes running the queries")
+    parser.add_argument('-l', '--limit', '--depth', type=int, default=DEFAULT_LIMIT,
+                        help="Number of results retrieved per query, 0 for all of them")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Use Whoosh's top-k optimizations, faster but the ranking of multifield "
+                             "queries may differ from the exhaustive one")
+    parser.add_argument('--depths', type=int, nargs='+', default=None,
+                        help="Measure the query latency at each of these depths, 0 for all results")
+    parser.add_argument('--timings-json', type=str, default=None,
+                        help="Save the latency percentiles to this json file")
     args = parser.parse_args()
 
     config = {'path': f"{INDEX_PATH}_{args.dataset}_{args.analyzer}",
               'scoring': SCORINGS[args.scoring],
-              'dataset': args.dataset}
+              'dataset': args.dataset,
+              'fields': DATASETS[args.dataset]['fields'],
+              'procs': args.procs,
+              'limit': args.limit or None,
+              'optimize': args.optimize,
+              'depths': [d or None for d in args.depths] if args.depths is not None else None,
+              'timings_json': args.timings_json}
 
     # set custom parameters for BM25F
     if args.scoring == 'bm25f':
@@ -74,10 +98,87 @@ def build_index_config():
     :return: str
     """
     parser = argparse.ArgumentParser(description="Build index")
-    parser.add_argument('-a', '--analyzer', default='simple',
-                        type=str, help=f"Choose among {list(ANALYZERS.keys())}")
+    parser.add_argument('-a', '--analyzer', default='simple', type=str,
+                        help=f"Choose among {list(ANALYZERS.keys())} or 'all' to build every index at once")
     parser.add_argument('-data', '--dataset', type=str, required=True,
                         help=f"Choose among {list(DATASETS.keys())}")
+    parser.add_argument('-p', '--procs', type=int, default=1,
+                        help="Number of processes parsing and indexing the documents, each one "
+                             "writing its own segment of every index")
+    parser.add_argument('--limitmb', type=int, default=128,
+                        help="Memory (MB) used by each writer before flushing to disk")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Merge all segments into one after indexing")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help="Only re-index documents added, changed or removed since the last run")
+    parser.add_argument('-e', '--extractor', type=str, default='bs4',
+                        help="Choose the html body extractor among ['bs4', 'regex']")
+    parser.add_argument('--validate', type=int, default=0,
+                        help="Compare the extractor against 'bs4' on a sample of this size before indexing")
+    args = parser.parse_args()
+
+    return {'analyzer': args.analyzer, 'dataset': args.dataset,
+            'procs': args.procs, 'limitmb': args.limitmb, 'optimize': args.optimize,
+            'incremental': args.incremental, 'extractor': args.extractor,
+            'validate': args.validate}
+
+
+def extractors_config():
+    """ Return the parameters of the extractors benchmark from command line
+
+    :return: dictionary
+    """
+    parser = argparse.ArgumentParser(description="Validate and benchmark html extractors")
+    parser.add_argument('-data', '--dataset', type=str, default='cranfield',
+                        help=f"Choose among {list(DATASETS.keys())}")
+    parser.add_argument('-n', '--sample', type=int, default=100,
+                        help="Number of documents on which the extractors are compared")
+    args = parser.parse_args()
+
+    return {'dataset': args.dataset, 'sample': args.sample}
+
+
+def sweep_config():
+    """ Return the parameters of the BM25F grid search from command line
+
+    :return: dictionary
+    """
+    parser = argparse.ArgumentParser(description="BM25F parameters grid search")
+    parser.add_argument('-a', '--analyzer', type=str, default='stemming',
+                        help=f"Choose among {list(ANALYZERS.keys())}")
+    parser.add_argument('-d', '--dataset', type=str, default='cranfield',
+                        help=f"Choose among {list(DATASETS.keys())}")
+    parser.add_argument('-B', type=float, nargs='+', default=[round(0.05 * i, 2) for i in range(21)],
+                        help="Values of B to try")
+    parser.add_argument('-K1', type=float, nargs='+', default=[round(0.1 * i, 1) for i in range(5, 31)],
+                        help="Values of K1 to try")
+    parser.add_argument('-t', '--top', type=int, default=10,
+                        help="Number of best configurations printed")
+    parser.add_argument('-l', '--limit', '--depth', type=int, default=DEFAULT_LIMIT,
+                        help="Number of results retrieved per query, 0 for all of them")
+    args = parser.parse_args()
+
+    return {'analyzer': args.analyzer, 'dataset': args.dataset,
+            'B': args.B, 'K1': args.K1, 'top': args.top, 'limit': args.limit or None}
+
+
+def main_config():
+    """ Return the parameters of the configurations grid from command line
+
+    :return: dictionary
+    """
+    parser = argparse.ArgumentParser(description="Evaluate all configurations")
+    parser.add_argument('-p', '--procs', type=int, default=1,
+                        help="Number of configurations evaluated in parallel")
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR,
+                        help="Directory where the metrics of each configuration are cached")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Recompute every configuration and do not update the cache")
+    parser.add_argument('-l', '--limit', '--depth', type=int, default=DEFAULT_LIMIT,
+                        help="Number of results retrieved per query, 0 for all of them")
+    parser.add_argument('--timings-json', type=str, default=None,
+                        help="Save the latency percentiles of each configuration to this json file")
     args = parser.parse_args()
 
-    return {'analyzer': args.analyzer, 'dataset': args.dataset}
+    return {'procs': args.procs, 'cache_dir': None if args.no_cache else args.cache_dir,
+            'limit': args.limit or None, 'timings_json': args.timings_json}
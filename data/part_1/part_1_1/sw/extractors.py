@@ -0,0 +1,127 @@
+from bs4 import BeautifulSoup
+from time import perf_counter
+import html
+import random
+import re
+
+BODY_REGEX = re.compile(r"<body[^>]*>(.*?)</body\s*>", re.IGNORECASE | re.DOTALL)
+TITLE_REGEX = re.compile(r"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+
+
+def bs4_fields(html_str):
+    """ Return the title and the text of the body of html_str, reference implementation
+
+    :param html_str: string
+    :return: dictionary {'title': string, 'content': string}
+        title is empty if the document has none
+    """
+    soup = BeautifulSoup(html_str, "html.parser")
+
+    title = ""
+    if soup.title is not None and soup.title.string is not None:
+        title = soup.title.string.strip()
+
+    return {'title': title, 'content': soup.body.string.strip()}
+
+
+def regex_fields(html_str):
+    """ Return the title and the text of the body of html_str without building
+        the DOM, assumes both contain only text (as in our datasets)
+
+    :param html_str: string
+    :return: dictionary {'title': string, 'content': string}
+        title is empty if the document has none
+    """
+    title = TITLE_REGEX.search(html_str)
+    body = BODY_REGEX.search(html_str)
+
+    return {'title': html.unescape(title.group(1)).strip() if title is not None else "",
+            'content': html.unescape(body.group(1)).strip()}
+
+
+EXTRACTORS = {'bs4': bs4_fields,
+              'regex': regex_fields}
+
+
+def read_html(pathname):
+    """ Return the content of the html file at pathname
+
+    :param pathname: string
+    :return: string
+    """
+    with open(pathname, "r") as file:
+        return file.read()
+
+
+def validate_extractors(files, sample_size=100, reference='bs4', candidate='regex', seed=0):
+    """ Check that two extractors return the same fields on a sample of files
+
+    :param files: list of strings
+    :param sample_size: int
+    :param reference: string
+        a key of EXTRACTORS
+    :param candidate: string
+        a key of EXTRACTORS
+    :param seed: int
+    :return: list of strings
+        pathnames on which the two extractors disagree
+    """
+    sample = random.Random(seed).sample(files, min(sample_size, len(files)))
+    mismatches = []
+
+    for pathname in sample:
+        html_str = read_html(pathname)
+
+        try:
+            same = EXTRACTORS[reference](html_str) == EXTRACTORS[candidate](html_str)
+        except AttributeError:
+            # one of the two could not find a text body
+            same = False
+
+        if not same:
+            mismatches.append(pathname)
+
+    return mismatches
+
+
+def benchmark_extractors(files, repeat=3):
+    """ Return the throughput of every extractor on files, only the
+        extraction is timed since the files are read beforehand
+
+    :param files: list of strings
+    :param repeat: int
+        the best of repeat runs is kept
+    :return: dictionary {extractor name: docs/sec}
+    """
+    documents = list(map(read_html, files))
+    throughput = {}
+
+    for name, extractor in EXTRACTORS.items():
+        best = float("inf")
+
+        for _ in range(repeat):
+            tic = perf_counter()
+            for html_str in documents:
+                extractor(html_str)
+            best = min(best, perf_counter() - tic)
+
+        throughput[name] = len(documents) / best
+
+    return throughput
+
+
+if __name__ == "__main__":
+    from config import DATASETS, extractors_config
+    from build_index import pathnames_from_dir
+
+    config = extractors_config()
+    files = pathnames_from_dir(DATASETS[config['dataset']]['dir'])
+
+    mismatches = validate_extractors(files, config['sample'])
+    print(f"Validated {min(config['sample'], len(files))} documents, {len(mismatches)} mismatches")
+    for pathname in mismatches:
+        print(f"\t{pathname}")
+
+    print(f"Benchmarking extractors on {len(files)} documents")
+    for name, docs_per_sec in benchmark_extractors(files).items():
+        print(f"{name}:\t{docs_per_sec:.1f} docs/sec")
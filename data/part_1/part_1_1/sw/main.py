@@ -1,8 +1,11 @@
 from config import *
 from utils import *
 from whoosh import index
+from multiprocessing import Pool
 import matplotlib.pyplot as plt
+import hashlib
 import pickle
+import os
 LARGE_SIZE = 20
 MEDIUM_SIZE = 15
 SMALL_SIZE = 12
@@ -31,15 +34,17 @@ CONFIG = [['stemming', 'bm25f', 0.7, 1.7],
 DATASET = ['cranfield', 'time']
 
 
-def parse_config(config_list):
+def parse_config(config_list, limit=DEFAULT_LIMIT):
     """ Takes a configuration from CONFIG and returns a dictionary
         with all the selected parameters
 
     :param config_list: list of strings/floats
         a list from CONFIG with 2 strings + 2 optional floats
+    :param limit: int
+        number of results retrieved per query, None for all of them
     :return: dictionary
     """
-    config_dict = dict()
+    config_dict = {'limit': limit}
 
     config_dict['index'] = config_list[0]
     config_dict['scoring_function'] = config_list[1]
@@ -83,11 +88,13 @@ def run_config(dataset_name, config_dict, verbose=True):
     # load selected dataset
     filtered_queries, queries_gt = load_dataset(dataset_name)
 
-    # open index
-    ix = index.open_dir(index_dir)
+    fieldboosts = DATASETS[dataset_name]['fields']
+    timings = QueryTimings()
 
-    # results for both sets of queries
-    results_ids = get_results_ids(ix, scoring_function, filtered_queries)
+    # results for both sets of queries, configurations run in parallel in run_grid()
+    ix = index.open_dir(index_dir)
+    results_ids = get_results_ids(ix, scoring_function, filtered_queries, fieldboosts,
+                                  config_dict['limit'], timings)
 
     # string name of the preprocessing used
     index_type = index_dir.split('_')[-1]
@@ -95,27 +102,124 @@ def run_config(dataset_name, config_dict, verbose=True):
     # save all performance metrics
     m = Metrics(index_type, dataset_name, scoring_str)
     m.compute_metrics(results_ids, queries_gt)
+    m.timings = timings.summary()
 
     if verbose:
         print(f"Index: {index_dir}")
         print(f"Dataset: {dataset_name}")
         print(f"Scoring function: {scoring_function.__class__.__name__}")
+        print_timings(m.timings)
         m.print_metrics()
 
     return m
 
 
+def cache_pathname(dataset_name, config_dict, cache_dir):
+    """ Return the pathname where the Metrics of a configuration are cached
+
+    :param dataset_name: string
+    :param config_dict: dictionary
+        output of parse_config()
+    :param cache_dir: string
+    :return: string
+    """
+    index_dir = f"{INDEX_PATH}_{dataset_name}_{config_dict['index']}"
+
+    # the fingerprint changes whenever the index is rebuilt or updated
+    key = (METRICS_VERSION, dataset_name, config_dict['index'], config_dict['scoring_function'],
+           config_dict['B'], config_dict['K1'], config_dict['limit'],
+           sorted(DATASETS[dataset_name]['fields'].items()),
+           index_fingerprint(index_dir))
+    digest = hashlib.md5(repr(key).encode()).hexdigest()
+
+    return os.path.join(cache_dir, f"{digest}.pkl")
+
+
+def cached_run_config(job):
+    """ Run a configuration unless its Metrics are already cached
+
+    :param job: tuple (dataset_name, config_dict, cache_dir)
+        cache_dir is None to disable the cache
+    :return: pair (Metrics object, bool)
+        the bool is True if the metrics were read from the cache
+    """
+    dataset_name, config_dict, cache_dir = job
+
+    if cache_dir is None:
+        return run_config(dataset_name, config_dict, verbose=False), False
+
+    pathname = cache_pathname(dataset_name, config_dict, cache_dir)
+
+    if os.path.exists(pathname):
+        with open(pathname, "rb") as f:
+            return pickle.load(f), True
+
+    m = run_config(dataset_name, config_dict, verbose=False)
+
+    # write then rename, so that a crash never leaves a truncated entry
+    with open(pathname + ".tmp", "wb") as f:
+        pickle.dump(m, f)
+    os.replace(pathname + ".tmp", pathname)
+
+    return m, False
+
+
+def run_grid(datasets, configs, procs=1, cache_dir=None, limit=DEFAULT_LIMIT):
+    """ Run every configuration on every dataset in a pool of processes
+
+    :param datasets: list of strings
+    :param configs: list of lists
+        configurations in the same format of CONFIG
+    :param procs: int
+    :param cache_dir: string
+        directory of the metrics cache, None to always recompute
+    :param limit: int
+        number of results retrieved per query, None for all of them
+    :return: dictionary {dataset: list of Metrics objects}
+        the metrics of each dataset follow the order of configs
+    """
+    if cache_dir is not None and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    jobs = [(dataset, parse_config(item, limit), cache_dir) for dataset in datasets for item in configs]
+
+    if procs > 1:
+        with Pool(procs) as pool:
+            outputs = pool.map(cached_run_config, jobs)
+    else:
+        outputs = list(map(cached_run_config, jobs))
+
+    metrics_list = {dataset: [] for dataset in datasets}
+    cached = 0
+
+    for (dataset, _, _), (m, from_cache) in zip(jobs, outputs):
+        metrics_list[dataset].append(m)
+        cached += int(from_cache)
+
+    print(f"Computed {len(jobs) - cached} configurations, {cached} read from cache")
+
+    return metrics_list
+
+
 if __name__ == "__main__":
-    metrics_list = {'cranfield': [], 'time': []}
+    args = main_config()
 
     # iterate over both datasets and all available configurations
+    metrics_list = run_grid(DATASET, CONFIG, args['procs'], args['cache_dir'], args['limit'])
+
     for dataset in DATASET:
-        for item in CONFIG:
-            config = parse_config(item)
+        for m in metrics_list[dataset]:
+            print(f"Dataset: {dataset}")
+            print(f"Configuration: {m}")
+
+            print_timings(m.timings)
+
+            m.print_metrics()
 
-            # run a single configuration test
-            metrics = run_config(dataset, config)
-            metrics_list[dataset].append(metrics)
+    if args['timings_json'] is not None:
+        timings_to_json([{'index': f"{m.dataset}_{m.index_type}", 'scoring': m.scoring_function,
+                          'timings': m.timings} for dataset in DATASET for m in metrics_list[dataset]],
+                        args['timings_json'])
 
     # take top5 configurations according to MRR
     top5_cranfield = sorted(metrics_list['cranfield'], key=lambda x: x.MRR, reverse=True)[:5]
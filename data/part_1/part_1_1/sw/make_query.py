@@ -16,11 +16,24 @@ if __name__ == "__main__":
     # load selected dataset
     filtered_queries, queries_gt = load_dataset(config['dataset'])
 
-    # open index
-    ix = index.open_dir(index_dir)
+    timings = QueryTimings()
 
     # results for both sets of queries
-    results_ids = get_results_ids(ix, scoring_function, filtered_queries)
+    if config['procs'] > 1:
+        results_ids = get_results_ids_parallel(index_dir, scoring_function, filtered_queries, config['fields'],
+                                               config['procs'], limit=config['limit'], timings=timings,
+                                               optimize=config['optimize'])
+    else:
+        ix = index.open_dir(index_dir)
+        results_ids = get_results_ids(ix, scoring_function, filtered_queries, config['fields'],
+                                      config['limit'], timings, config['optimize'])
+
+    print()
+    print_timings(timings.summary())
+
+    if config['timings_json'] is not None:
+        timings_to_json([{'index': index_dir, 'scoring': scoring_function.__class__.__name__,
+                          'timings': timings.summary()}], config['timings_json'])
 
     # compute metrics
     MRR = mean_reciprocal_rank(results_ids, queries_gt)
@@ -46,3 +59,13 @@ if __name__ == "__main__":
     # Normalized Discounted Cumulative Gain at k plot
     ndcg_at_k = [mean_ndcg(results_ids, queries_gt, k) for k in K_VAL]
     print(f"NDCG@k {ndcg_at_k}")
+
+    # latency at different result depths
+    if config['depths'] is not None:
+        ix = index.open_dir(index_dir)
+        latency = depth_latency(ix, scoring_function, filtered_queries, config['depths'], config['fields'],
+                                optimize=config['optimize'])
+
+        print("Depth\tms/query")
+        for depth, seconds in latency.items():
+            print(f"{depth if depth is not None else 'all'}\t{1000 * seconds:.3f}")
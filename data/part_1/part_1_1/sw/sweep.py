@@ -0,0 +1,196 @@
+from whoosh import index
+from whoosh.query import Term, And, Or, NullQuery
+from time import perf_counter
+from config import *
+from utils import *
+import numpy as np
+
+
+def check_query(query):
+    """ Raises ValueError if query is not made only of terms combined with
+        AND/OR, the only queries whose BM25F score is the sum of its terms
+
+    :param query: Whoosh query
+    :return: None
+    """
+    # subclasses of Term (fuzzy, variations) expand to other terms
+    if type(query) is Term or query is NullQuery:
+        return
+
+    # Not, AndNot, Phrase, Wildcard, Prefix, FuzzyTerm, ... are not supported
+    if type(query) not in (And, Or):
+        raise ValueError(f"Unsupported {type(query).__name__} in query {query}, "
+                         f"only terms combined with AND/OR can be swept")
+
+    for child in query.children():
+        check_query(child)
+
+
+def extract_postings(ix, queries, fieldboosts=None):
+    """ Reads once from the index everything BM25F needs to score the queries:
+        the matching documents, the term frequencies, the field lengths and
+        the field statistics of every term of every query
+
+    :param ix: Whoosh index
+    :param queries: dictionary {query_id: string}
+    :param fieldboosts: dictionary {field name: boost}
+        fields searched by the queries, if None only content
+    :return: pair (postings, doc_ids)
+        postings is a dictionary {query_id: dictionary of numpy arrays} with keys
+        'docs' (C docnums matching the query), 'tf' and 'dl' (L x C frequencies
+        and field lengths for the L terms), 'idf', 'avgfl' and 'boost' (L values)
+        doc_ids is the array mapping a docnum to its document id
+    """
+    postings = {}
+
+    with ix.searcher() as searcher:
+        reader = searcher.reader()
+        qp = query_parser(ix.schema, fieldboosts)
+        n_docs = reader.doc_count_all()
+
+        # document id of each docnum, -1 for deleted documents
+        doc_ids = np.full(n_docs, -1, dtype=int)
+        for docnum in reader.all_doc_ids():
+            doc_ids[docnum] = int(reader.stored_fields(docnum)['id'])
+
+        parsed_queries = {i: qp.parse(q) for i, q in queries.items()}
+        for parsed_query in parsed_queries.values():
+            check_query(parsed_query)
+
+        matching = {i: np.array(sorted(d for d in parsed_query.docs(searcher) if doc_ids[d] >= 0), dtype=int)
+                    for i, parsed_query in parsed_queries.items()}
+
+        # field lengths, as quantized by whoosh, only of the documents matching
+        # some query: the same lookups a search of every query does
+        fields = list(fieldboosts.keys()) if fieldboosts is not None else ["content"]
+        needed = np.unique(np.concatenate([np.empty(0, dtype=int)] + list(matching.values())))
+        lengths = {f: np.ones(n_docs) for f in fields}
+
+        for f in fields:
+            lengths[f][needed] = [reader.doc_field_length(d, f, 1) for d in needed.tolist()]
+
+        for i, parsed_query in parsed_queries.items():
+            # documents matching the query, the only ones that get a score
+            docs = matching[i]
+            leaves = [leaf for leaf in parsed_query.leaves() if leaf is not NullQuery]
+
+            tf = np.zeros((len(leaves), len(docs)))
+            dl = np.ones((len(leaves), len(docs)))
+
+            for j, leaf in enumerate(leaves):
+                dl[j] = lengths[leaf.fieldname][docs]
+
+                if len(docs) == 0 or (leaf.fieldname, leaf.text) not in reader:
+                    continue
+
+                items = np.array(list(reader.postings(leaf.fieldname, leaf.text).items_as("weight")))
+                positions = np.searchsorted(docs, items[:, 0].astype(int))
+                found = (positions < len(docs)) & (docs[np.minimum(positions, len(docs) - 1)] == items[:, 0])
+                tf[j, positions[found]] = items[found, 1]
+
+            postings[i] = {'docs': docs,
+                           'tf': tf,
+                           'dl': dl,
+                           'idf': np.array([searcher.idf(l.fieldname, l.text) for l in leaves]),
+                           'avgfl': np.array([searcher.avg_field_length(l.fieldname) or 1 for l in leaves]),
+                           'boost': np.array([l.boost for l in leaves], dtype=float)}
+
+    return postings, doc_ids
+
+
+def bm25_scores(query_postings, B, K1):
+    """ Returns the BM25F scores of the documents matching a query for all the
+        (B, K1) pairs at once
+
+    :param query_postings: dictionary of numpy arrays
+        a value of the output of extract_postings()
+    :param B: numpy array of G floats
+    :param K1: numpy array of G floats
+    :return: numpy array G x C
+        score of each of the C matching documents for each (B, K1) pair
+    """
+    tf, dl = query_postings['tf'][None], query_postings['dl'][None]
+    avgfl = query_postings['avgfl'][None, :, None]
+    B, K1 = B[:, None, None], K1[:, None, None]
+
+    # same formula as whoosh.scoring.bm25, broadcasted to G x L x C
+    norm = tf + K1 * ((1 - B) + B * dl / avgfl)
+    weight = (query_postings['boost'] * query_postings['idf'])[None, :, None]
+
+    return (weight * (tf * (K1 + 1)) / norm).sum(axis=1)
+
+
+def bm25_sweep(postings, doc_ids, grid, limit=DEFAULT_LIMIT, chunk=64):
+    """ Ranks the documents of every query for every (B, K1) pair of grid
+
+    :param postings: dictionary
+        output of extract_postings()
+    :param doc_ids: numpy array
+        output of extract_postings()
+    :param grid: list of pairs (B, K1)
+    :param limit: int
+        number of results kept per query, None for all of them
+    :param chunk: int
+        number of (B, K1) pairs scored together, bounds the memory used
+    :return: list of dictionaries {query_id: list of ids}
+        one for each pair of grid, as returned by get_results_ids()
+    """
+    grid = np.asarray(grid, dtype=float)
+    results = [dict() for _ in range(len(grid))]
+
+    for i, query_postings in postings.items():
+        docs = query_postings['docs']
+
+        for start in range(0, len(grid), chunk):
+            scores = bm25_scores(query_postings, grid[start:start + chunk, 0], grid[start:start + chunk, 1])
+
+            for g, row in enumerate(scores):
+                # highest scores first, ties broken by docnum like whoosh
+                top = np.lexsort((docs, -row))[:limit]
+                results[start + g][i] = doc_ids[docs[top]].tolist()
+
+    return results
+
+
+def sweep_metrics(dataset_name, index_type, grid, limit=DEFAULT_LIMIT):
+    """ Returns the metrics of BM25F for every (B, K1) pair in grid
+
+    :param dataset_name: string
+    :param index_type: string
+        a key of ANALYZERS
+    :param grid: list of pairs (B, K1)
+    :param limit: int
+        number of results kept per query, None for all of them
+    :return: list of Metrics objects
+    """
+    filtered_queries, queries_gt = load_dataset(dataset_name)
+    ix = index.open_dir(f"{INDEX_PATH}_{dataset_name}_{index_type}")
+
+    postings, doc_ids = extract_postings(ix, filtered_queries, DATASETS[dataset_name]['fields'])
+    results = bm25_sweep(postings, doc_ids, grid, limit)
+
+    metrics_list = []
+
+    for (B, K1), results_ids in zip(grid, results):
+        m = Metrics(index_type, dataset_name, f"bm25f({B:g},{K1:g})")
+        m.compute_metrics(results_ids, queries_gt)
+        metrics_list.append(m)
+
+    return metrics_list
+
+
+if __name__ == "__main__":
+    config = sweep_config()
+
+    grid = [(B, K1) for B in config['B'] for K1 in config['K1']]
+    print(f"Sweeping {len(grid)} (B, K1) pairs on {config['dataset']} with {config['analyzer']} index")
+
+    tic = perf_counter()
+    metrics_list = sweep_metrics(config['dataset'], config['analyzer'], grid, config['limit'])
+    elapsed = perf_counter() - tic
+
+    print(f"Finished in {elapsed:.2f} seconds\n")
+
+    # best configurations according to MRR
+    for m in sorted(metrics_list, key=lambda x: x.MRR, reverse=True)[:config['top']]:
+        print(f"{m}\tMRR: {m.MRR:.3f}\tR-Precision: {m.rps['mean']:.3f}")
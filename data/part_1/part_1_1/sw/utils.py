@@ -1,16 +1,30 @@
 from whoosh.qparser import *
-from collections import defaultdict
+from whoosh import index, collectors
 from contextlib import suppress
+from multiprocessing import Pool
+from time import perf_counter
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import csv
+import hashlib
+import json
+import os
+
+# shared evaluation package in data/part_1, installed with pip install -e data/part_1
+import evaluation
+from evaluation import Run, Qrels, compute_stats
 
 sns.set_theme()
 
 K_VAL = [1, 3, 5, 10]
 
+# number of results retrieved per query, whoosh default, None retrieves all
+DEFAULT_LIMIT = 10
+
+# searcher and parser owned by each process of get_results_ids_parallel()
+_worker = {}
+
 
 class Metrics(object):
     def __init__(self, index_type, dataset, scoring_function):
@@ -21,7 +35,9 @@ class Metrics(object):
         self.rp = None
         self.rps = None
         self.rp_at_k = None
+        self.r_at_k = None
         self.ndcg_at_k = None
+        self.timings = None
 
     def compute_metrics(self, results_ids, queries_gt):
         """ Given the query results and the ground truth computes
@@ -32,18 +48,24 @@ class Metrics(object):
         :param queries_gt: dictionary
         :return:
         """
+        # build the relevance matrix once, every metric is computed from it
+        run = Run.from_dict(results_ids)
+        rel, n_rel = evaluation.relevance_matrix(run, Qrels.from_dict(queries_gt), max(K_VAL))
+        metrics = evaluation.vectorized_metrics(rel, n_rel, K_VAL)
+
         # compute metrics
-        self.MRR = mean_reciprocal_rank(results_ids, queries_gt)
+        self.MRR = metrics['MRR']
 
         # compute R-precision
-        self.rp = recall_at_k(results_ids, queries_gt)
+        self.rp = dict(zip(run.query_ids.tolist(), metrics['r_precision']))
         self.rps = compute_stats(self.rp)
 
-        # Precision at k plot
-        self.rp_at_k = [compute_stats(precision_at_k(results_ids, queries_gt, k))['mean'] for k in K_VAL]
+        # Precision and Recall at k plot
+        self.rp_at_k = [metrics['precision'][k].mean() for k in K_VAL]
+        self.r_at_k = [metrics['recall'][k].mean() for k in K_VAL]
 
         # Normalized Discounted Cumulative Gain at k plot
-        self.ndcg_at_k = [mean_ndcg(results_ids, queries_gt, k) for k in K_VAL]
+        self.ndcg_at_k = [metrics['ndcg'][k].mean() for k in K_VAL]
 
     def print_metrics(self):
         """ Print to console the metrics computed """
@@ -65,63 +87,92 @@ class Metrics(object):
         return f"{self.index_type}-{self.scoring_function}"
 
 
-def load_queries(pathname):
-    """ Returns the list of queries contained in the target pathname tsv file
+class QueryTimings(object):
+    STAGES = ["parse", "search", "extract"]
 
-    :param pathname: string
-    :return: dictionary {query_id: string}
-    """
-    queries = {}
+    def __init__(self):
+        """ Collects the time spent by every query in each stage of
+            search_ids(), in seconds
+        """
+        self.samples = {stage: [] for stage in self.STAGES}
+        self.wall = 0.0
 
-    with open(pathname) as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
 
-        # skip header
-        next(reader, None)
+    def merge(self, other):
+        """ Adds the samples of another QueryTimings, e.g. from a worker process
 
-        for k, v in reader:
-            queries[int(k)-1] = v
+        :param other: QueryTimings object
+        """
+        for stage in self.STAGES:
+            self.samples[stage] += other.samples[stage]
 
-    return queries
+    def summary(self):
+        """ Returns the latency percentiles of each stage and the throughput
 
+        :return: dictionary
+            {stage: {'p50': ms, 'p95': ms, 'p99': ms}} for each stage and for
+            the total, plus 'queries' and 'qps' computed on the wall time
+        """
+        totals = np.sum([self.samples[stage] for stage in self.STAGES], axis=0)
+        summary = {'queries': len(totals),
+                   'qps': len(totals) / self.wall if self.wall > 0 else None}
 
-def load_ground_truth(pathname):
-    """ Returns a dictionary of query_id: [results_ids]
+        for stage, values in list(self.samples.items()) + [("total", totals)]:
+            p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99]) if len(values) > 0 else [None] * 3
+            summary[stage] = {'p50': p50, 'p95': p95, 'p99': p99}
 
-    :param pathname: string
-    :return: dictionary {query_id: list of ids}, ids as int
+        return summary
+
+
+def print_timings(summary):
+    """ Print to console the output of QueryTimings.summary()
+
+    :param summary: dictionary
     """
-    queries_gt = defaultdict(list)
+    lines = ["[Latency (ms)]",
+             "Stage\t\tp50\tp95\tp99"]
 
-    with open(pathname) as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
+    for stage in QueryTimings.STAGES + ["total"]:
+        # percentiles are None when no query was timed
+        p = ["n/a" if summary[stage][q] is None else f"{summary[stage][q]:.3f}" for q in ['p50', 'p95', 'p99']]
+        lines.append(f"{stage}\t\t" + "\t".join(p))
 
-        # skip header
-        next(reader, None)
+    if summary['qps'] is not None:
+        lines.append(f"QPS: {summary['qps']:.1f}")
 
-        for k, v in reader:
-            queries_gt[int(k) - 1].append(int(v))
+    print("\n".join(lines))
 
-    return queries_gt
 
+def timings_to_json(timings, pathname):
+    """ Saves a list of latency summaries to a json file
 
-def reciprocal_rank(result, gt):
-    """ Computes the reciprocal rank of the two lists
+    :param timings: list of dictionaries
+        each one has the keys 'index', 'scoring' and 'timings', the latter
+        being the output of QueryTimings.summary()
+    :param pathname: string
+    """
+    with open(pathname, "w") as f:
+        json.dump(timings, f, indent=2)
 
-    :param result: set of ints
-    :param gt: set of ints
-    :return: reciprocal rank of
+
+def load_queries(pathname):
+    """ Returns the list of queries contained in the target pathname tsv file
+
+    :param pathname: string
+    :return: dictionary {query_id: string}
     """
-    common = list(set.intersection(set(result), set(gt)))
+    return evaluation.load_queries(pathname, query_offset=-1)
 
-    # 0 if no relevant query
-    if len(common) == 0:
-        return 0
 
-    # first relevant query
-    rank = min(list(map(lambda x: result.index(x), common))) + 1
+def load_ground_truth(pathname):
+    """ Returns a dictionary of query_id: [results_ids]
 
-    return 1 / rank
+    :param pathname: string
+    :return: dictionary {query_id: list of ids}, ids as int
+    """
+    return evaluation.load_ground_truth(pathname, query_offset=-1).to_dict()
 
 
 def queries_with_gt(queries, gt):
@@ -140,154 +191,288 @@ def queries_with_gt(queries, gt):
     return filtered
 
 
-def get_results_ids(ix, scoring_function, queries):
+def query_parser(schema, fieldboosts=None):
+    """ Returns the query parser over the fields in fieldboosts
+
+    :param schema: Whoosh schema
+    :param fieldboosts: dictionary {field name: boost}
+        if None only the content field is searched
+    :return: Whoosh QueryParser
+    """
+    if fieldboosts is None:
+        return QueryParser("content", schema)
+
+    return MultifieldParser(list(fieldboosts.keys()), schema, fieldboosts=fieldboosts)
+
+
+def get_results_ids(ix, scoring_function, queries, fieldboosts=None, limit=DEFAULT_LIMIT, timings=None,
+                    optimize=False):
     """ Returns a dictionary containing a list of documents ids for each query
 
     :param ix: Whoosh index
     :param scoring_function: Whoosh scoring function
     :param queries: list of strings
+    :param fieldboosts: dictionary {field name: boost}
+        fields searched by the queries, if None only content
+    :param limit: int
+        maximum number of results per query, None for all of them
+    :param timings: QueryTimings object
+        if not None collects the time spent in each stage
+    :param optimize: bool
+        see top_results()
     :return:
     """
     results_ids = {}
+    tic = perf_counter()
 
     with ix.searcher(weighting=scoring_function) as searcher:
-        qp = QueryParser("content", ix.schema)
+        qp = query_parser(ix.schema, fieldboosts)
 
         for i, q in queries.items():
-            # parse query
-            parsed_query = qp.parse(q)
+            results_ids[i] = search_ids(searcher, qp, q, limit, timings, optimize)
 
-            # get results ids
-            results = searcher.search(parsed_query)
-            results_ids[i] = list(map(lambda x: int(x['id']), results))
+    if timings is not None:
+        timings.wall += perf_counter() - tic
 
     return results_ids
 
 
-def recall_at_k(results_ids, results_gt, k=None):
-    """ Returns a dictionary representing the recall at k
+def search_ids(searcher, qp, q, limit=DEFAULT_LIMIT, timings=None, optimize=False):
+    """ Returns the list of documents ids retrieved for the query q
 
-    :param results_ids: dictionary {query_id: [list of ids]}
-    :param results_gt: dictionary {query_id: [list of ids]}
-    :param k: int
-        if None is equivalent to computing the R-Precision by considering
-        all relevant documents returned
-    :return: dictionary {query_id: r-precision}
+    :param searcher: Whoosh searcher
+    :param qp: Whoosh QueryParser
+    :param q: string
+    :param limit: int
+        maximum number of results, None for all of them
+    :param timings: QueryTimings object
+        if not None collects the time spent in each stage
+    :param optimize: bool
+        see top_results()
+    :return: list of ints
     """
-    recall_dict = dict()
+    t0 = perf_counter()
 
-    for query_id, docs_id in results_ids.items():
-        # current ground truth
-        gt = results_gt[query_id]
+    # parse query
+    parsed_query = qp.parse(q)
+    t1 = perf_counter()
 
-        if k is None:
-            k = len(gt)
+    # get results ids
+    results = top_results(searcher, parsed_query, limit, optimize)
+    t2 = perf_counter()
 
-        # compute recall
-        relevant_returned = len(list(set(gt).intersection(set(docs_id[:k]))))
-        total_relevant = len(gt)
-        recall_dict[query_id] = relevant_returned / total_relevant
+    ids = list(map(lambda x: int(x['id']), results))
 
-    return recall_dict
+    if timings is not None:
+        timings.add("parse", t1 - t0)
+        timings.add("search", t2 - t1)
+        timings.add("extract", perf_counter() - t2)
 
+    return ids
 
-def precision_at_k(results_ids, results_gt, k=None):
-    """ Returns the dictionary of R-precision for each query
 
-    :param results_ids: dictionary {query_id: [list of ids]}
-    :param results_gt: dictionary {query_id: [list of ids]}
-    :param k: int
-    :return: dictionary {query_id: r-precision}
+def top_results(searcher, parsed_query, limit=DEFAULT_LIMIT, optimize=False):
+    """ Returns the limit best results of a query, the same of a search
+        without limit cut to the first limit results
+
+        Whoosh's default top-k collector periodically replaces the matcher
+        with one that skips the documents which cannot enter the top-k, but
+        the bounds it uses are wrong for boosted multifield queries and it
+        drops documents that belong to the top-k. Unless optimize is True,
+        every matching document is scored and only the best limit are kept
+        in a heap.
+
+    :param searcher: Whoosh searcher
+    :param parsed_query: Whoosh query
+    :param limit: int
+        maximum number of results, None for all of them
+    :param optimize: bool
+        if True uses whoosh's block quality optimizations and matcher
+        replacement, faster on deep posting lists but inexact
+    :return: Whoosh Results
     """
-    rp = {}
+    if limit is None or optimize:
+        return searcher.search(parsed_query, limit=limit)
 
-    for i, ids in results_ids.items():
-        # current ground truth
-        gt = results_gt[i]
-        size = len(gt)
+    collector = collectors.TopCollector(limit, usequality=False, replace=0)
+    searcher.search_with_collector(parsed_query, collector)
 
-        # consider the first len(gt) documents
-        if k is None:
-            k = size
+    return collector.results()
 
-        ids = ids[:k]
 
-        r = len(list(set(gt).intersection(set(ids))))
-        rp[i] = r / k
+def _init_search_worker(index_dir, scoring_function, fieldboosts, limit, optimize):
+    """ Opens the index and a searcher in the current worker process """
+    ix = index.open_dir(index_dir)
+    _worker['searcher'] = ix.searcher(weighting=scoring_function)
+    _worker['parser'] = query_parser(ix.schema, fieldboosts)
+    _worker['limit'] = limit
+    _worker['optimize'] = optimize
 
-    return rp
+
+def _search_batch(batch):
+    """ Returns the pairs (query_id, list of ids) for a batch of (query_id, query)
+        together with the QueryTimings of the batch
+    """
+    timings = QueryTimings()
+    results = [(i, search_ids(_worker['searcher'], _worker['parser'], q, _worker['limit'], timings,
+                              _worker['optimize']))
+               for i, q in batch]
+    return results, timings
 
 
-def compute_stats(rp):
-    """ Return a dictionary of stats on R-Precision
+def get_results_ids_parallel(index_dir, scoring_function, queries, fieldboosts=None, procs=2,
+                             batch_size=8, limit=DEFAULT_LIMIT, timings=None, optimize=False):
+    """ Same as get_results_ids() but the queries are split in batches and
+        executed by a pool of procs processes, each one with its own searcher
+        on the index stored in index_dir
 
-    :param rp: dictionary {query_id: float}
-    :return: dictionary {string: float}
+    :param index_dir: string
+    :param scoring_function: Whoosh scoring function
+    :param queries: dictionary {query_id: string}
+    :param fieldboosts: dictionary {field name: boost}
+    :param procs: int
+    :param batch_size: int
+        number of queries sent to a worker at once
+    :param limit: int
+        maximum number of results per query, None for all of them
+    :param timings: QueryTimings object
+        if not None collects the time spent in each stage by the workers
+    :param optimize: bool
+        see top_results()
+    :return: dictionary {query_id: list of ids}
+        same content and order of get_results_ids()
     """
-    vals = list(rp.values())
-    stats = {'min': np.min(vals),
-             'max': np.max(vals),
-             'mean': np.mean(vals),
-             'median': np.median(vals),
-             'first_quartile': np.quantile(vals, 0.25),
-             'third_quartile': np.quantile(vals, 0.75)}
+    tic = perf_counter()
+    items = list(queries.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    results_ids = {}
 
-    return stats
+    with Pool(procs, initializer=_init_search_worker,
+              initargs=(index_dir, scoring_function, fieldboosts, limit, optimize)) as pool:
+        # imap returns the batches in order, so the dict keeps the query order
+        for batch_results, batch_timings in pool.imap(_search_batch, batches):
+            results_ids.update(batch_results)
 
+            if timings is not None:
+                timings.merge(batch_timings)
 
-def mean_reciprocal_rank(results_ids, results_gt):
-    """ Compute the mean reciprocal rank
+    if timings is not None:
+        timings.wall += perf_counter() - tic
 
-    :param results_ids: dictionary {query_id: [list of ids]}
-    :param results_gt: dictionary {query_id: [list of ids]}
-    :return: dictionary {query_id: [results_ids]}
+    return results_ids
+
+
+def depth_latency(ix, scoring_function, queries, depths, fieldboosts=None, repeat=3, optimize=False):
+    """ Returns the mean latency of a query for each result depth
+
+    :param ix: Whoosh index
+    :param scoring_function: Whoosh scoring function
+    :param queries: dictionary {query_id: string}
+    :param depths: list of ints
+        limits to measure, None retrieves all the results
+    :param fieldboosts: dictionary {field name: boost}
+    :param repeat: int
+        the best of repeat runs is kept for each depth
+    :param optimize: bool
+        see top_results()
+    :return: dictionary {depth: seconds per query}
     """
-    q_size = len(results_ids)
-    cumulative_rank = 0
+    latency = {}
+
+    with ix.searcher(weighting=scoring_function) as searcher:
+        qp = query_parser(ix.schema, fieldboosts)
+
+        for depth in depths:
+            best = float("inf")
 
-    for i, ids in results_ids.items():
+            for _ in range(repeat):
+                tic = perf_counter()
+                for q in queries.values():
+                    search_ids(searcher, qp, q, depth, optimize=optimize)
+                best = min(best, perf_counter() - tic)
 
-        # add reciprocal rank
-        cumulative_rank += reciprocal_rank(ids, results_gt[i])
+            latency[depth] = best / len(queries)
 
-    return cumulative_rank / q_size
+    return latency
 
 
-def normalized_dcg(results_ids, results_gt, k=None):
-    """ Return the discounted cumulative gain
+def index_fingerprint(index_dir):
+    """ Returns a digest identifying the current content of an index
+
+    :param index_dir: string
+    :return: string
+        changes whenever a file of the index is added, removed or rewritten
+    """
+    h = hashlib.md5()
+
+    for filename in sorted(os.listdir(index_dir)):
+        # the lock only exists while a writer is open
+        if filename.endswith("WRITELOCK"):
+            continue
+
+        stat = os.stat(os.path.join(index_dir, filename))
+        h.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+
+    return h.hexdigest()
+
+
+def recall_at_k(results_ids, results_gt, k=None):
+    """ Returns a dictionary representing the recall at k
 
-    :param results_ids: list of ints
-    :param results_gt: list of ints
+    :param results_ids: dictionary {query_id: [list of ids]}
+    :param results_gt: dictionary {query_id: [list of ids]}
     :param k: int
-    :return: float
+        if None is equivalent to computing the R-Precision by considering
+        all relevant documents returned
+    :return: dictionary {query_id: r-precision}
     """
-    total = 0.0
+    run = Run.from_dict(results_ids)
+    qrels = Qrels.from_dict(results_gt)
 
     if k is None:
-        k = min(len(results_ids), k)
+        values = evaluation.precision_at_k(run, qrels)
+    else:
+        values = evaluation.recall_at_k(run, qrels, k)
+
+    return dict(zip(run.query_ids.tolist(), values))
+
+
+def precision_at_k(results_ids, results_gt, k=None):
+    """ Returns the dictionary of R-precision for each query
+
+    :param results_ids: dictionary {query_id: [list of ids]}
+    :param results_gt: dictionary {query_id: [list of ids]}
+    :param k: int
+        if None the R-precision is computed
+    :return: dictionary {query_id: r-precision}
+    """
+    run = Run.from_dict(results_ids)
+    values = evaluation.precision_at_k(run, Qrels.from_dict(results_gt), k)
 
-    # normalization factor wrt gt
-    norm = 1 + sum(map(lambda x: 1 / np.log2(x + 1), range(1, k)))
+    return dict(zip(run.query_ids.tolist(), values))
 
-    for i in range(k):
-        # binary relevance (1 if in gt, 0 otherwise)
-        rel = int(results_ids[i] in results_gt)
-        den = 1 if i == 0 else np.log2(i+1)
-        total += (rel / den)
 
-    return total / norm
+def mean_reciprocal_rank(results_ids, results_gt):
+    """ Compute the mean reciprocal rank
+
+    :param results_ids: dictionary {query_id: [list of ids]}
+    :param results_gt: dictionary {query_id: [list of ids]}
+    :return: float
+    """
+    rel, n_rel = evaluation.relevance_matrix(Run.from_dict(results_ids), Qrels.from_dict(results_gt))
+    return evaluation.vectorized_metrics(rel, n_rel, [])['MRR']
 
 
 def mean_ndcg(results_ids, results_gt, k):
     """ Returns the average normalized DCG
 
-    :param results_ids: list of list of ints
-    :param results_gt: list of list of ints
+    :param results_ids: dictionary {query_id: [list of ids]}
+    :param results_gt: dictionary {query_id: [list of ids]}
     :param k: int
     :return: float
     """
-    totals = [normalized_dcg(results_ids[i], results_gt[i], k) for i in results_ids.keys()]
-    return sum(totals) / len(totals)
+    rel, n_rel = evaluation.relevance_matrix(Run.from_dict(results_ids), Qrels.from_dict(results_gt), k)
+    return evaluation.vectorized_metrics(rel, n_rel, [k])['ndcg'][k].mean()
 
 
 def dataframe_from_metrics(metrics_list):
@@ -1,22 +1,59 @@
 from utils import *
 
+# shared evaluation package in data/part_1, installed with pip install -e data/part_1
+from evaluation import load_ground_truth, compute_stats, evaluate_run_file, compare_engines, MetricTable
+
+# bootstrap resamples and permutations, significance level and seed of the comparison
+N_RESAMPLES = 10000
+ALPHA = 0.05
+SEED = 0
+
+# per query metrics of all the engines, for downstream analysis
+METRICS_PATH = "./part_1_2__metrics.csv"
+
+# queries of the ground truth without results score 0, see queries_with_gt();
+# with False only the queries answered by every engine are evaluated
+KEEP_MISSING = True
+
 if __name__ == "__main__":
-    datasets = [f"../dataset/part_1_2__Results_SE_{i}.tsv" for i in [1, 2, 3]]
+    engines = [f"SE_{i}" for i in [1, 2, 3]]
+    datasets = [f"../dataset/part_1_2__Results_{e}.tsv" for e in engines]
 
-    # loading ground truth and search engine results
+    # loading ground truth
     gt = load_ground_truth("../dataset/part_1_2__Ground_Truth.tsv")
-    pred = [queries_with_gt(load_queries_results(d), gt) for d in datasets]
+
+    # streaming the search engine results, only the top 4 of each query are kept,
+    # k is clamped to the number of relevant documents
+    evaluators = [evaluate_run_file(d, gt, 4, clamp_k=True) for d in datasets]
+
+    # all the metrics are aligned on the same queries of gt
+    evaluated = np.ones(len(gt), dtype=bool) if KEEP_MISSING else np.all([e.seen for e in evaluators], axis=0)
+    table = MetricTable(gt.query_ids[evaluated])
+
+    for engine, evaluator in zip(engines, evaluators):
+        table.add("precision", engine, evaluator.precision[evaluated])
+        table.add("recall", engine, evaluator.recall[evaluated])
+
+    # F-score of every query, 0 where precision and recall are both 0
+    fscore_name = table.add_fbeta(beta=1.0, zero_division=0.0)
+    table.to_csv(METRICS_PATH)
 
     # computing precision at k=4 stats
-    precision_at_4 = [precision_at_k(pred[i], gt, 4) for i in range(3)]
-    precision_stats = [compute_stats(x) for x in precision_at_4]
+    precision_stats = [compute_stats(x) for x in table.matrix("precision")]
     print_stats(precision_stats, title="Precision at 4")
 
     # computing recall at k=4 stats
-    recall_at_4 = [recall_at_k(pred[i], gt, 4) for i in range(3)]
-    recall_stats = [compute_stats(x) for x in recall_at_4]
+    recall_stats = [compute_stats(x) for x in table.matrix("recall")]
     print_stats(recall_stats, title="Recall at 4")
 
     # Average F-score
-    fscore = [fscore_from_pr(p, r) for p, r in zip(precision_at_4, recall_at_4)]
-    print_fscores(fscore)
+    print_fscores(list(table.mean(fscore_name).values()))
+    print()
+
+    # significance of the differences between the engines
+    titles = {"precision": "Precision at 4", "recall": "Recall at 4", fscore_name: "F-score at 4"}
+
+    for metric, title in titles.items():
+        comparison = compare_engines(table.matrix(metric), n_resamples=N_RESAMPLES, alpha=ALPHA, seed=SEED)
+        print_significance(comparison, title=f"{title}, {1 - ALPHA:.0%} bootstrap intervals and permutation tests",
+                           alpha=ALPHA)
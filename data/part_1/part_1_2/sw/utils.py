@@ -1,143 +1,22 @@
-from collections import defaultdict
-from contextlib import suppress
-import csv
 import numpy as np
 
 
-def load_queries_results(pathname):
-    """ Returns a dictionary of query_id: [results_ids]
-
-    :param pathname: string
-    :return: dictionary {query_id: list of ids}
-        list of ids is sorted by rank
-    """
-    results = defaultdict(list)
-
-    with open(pathname) as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
-
-        # skip header
-        next(reader, None)
-
-        for query_id, doc_id, rank in reader:
-            results[int(query_id)].append([int(doc_id), int(rank)])
-
-    # sort by rank and drop it
-    for query_id, doc_id in results.items():
-        results[query_id] = [x[0] for x in sorted(doc_id, key=lambda x: x[1])]
-
-    return results
-
-
-def load_ground_truth(pathname):
-    """ Returns a dictionary of query_id: [results_ids]
-
-    :param pathname: string
-    :return: dictionary {query_id: list of ids}, ids as int
-    """
-    queries_gt = defaultdict(list)
-
-    with open(pathname) as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
-
-        # skip header
-        next(reader, None)
-
-        for query_id, doc_id in reader:
-            queries_gt[int(query_id)].append(int(doc_id))
-
-    return queries_gt
-
-
-def queries_with_gt(queries, gt):
+def queries_with_gt(run, gt, keep_missing=True):
     """ Filters the query for which there is a ground truth
 
-    :param queries: dictionary of queries {query_id: string}
-    :param gt: dictionary of ground truth results {query_id: list of ints}
-    :return: dictionary of queries with a ground truth
-    """
-    filtered = {}
-
-    for query_id in gt.keys():
-        with suppress(KeyError):
-            filtered[query_id] = queries[query_id]
-
-    return filtered
-
-
-def recall_at_k(results_ids, results_gt, k=None):
-    """ Returns the dictionary of R-precision for each query
-
-    :param results_ids: dictionary {query_id: [list of ids]}
-    :param results_gt: dictionary {query_id: [list of ids]}
-    :param k: int
-        if None is equivalent to computing the R-Precision by considering
-        all relevant documents returned
-    :return: dictionary {query_id: r-precision}
-    """
-    recall_dict = dict()
-
-    for query_id, docs_id in results_ids.items():
-        # current ground truth
-        gt = results_gt[query_id]
-
-        if k is None:
-            k = len(docs_id)
-
-        # handle case of number of gt ids < k
-        k = min(k, len(gt))
-
-        # compute recall
-        relevant_returned = len(list(set(gt).intersection(set(docs_id[:k]))))
-        total_relevant = len(gt)
-        recall_dict[query_id] = relevant_returned / total_relevant
-
-    return recall_dict
-
-
-def precision_at_k(results_ids, results_gt, k):
-    """ Returns the dictionary of R-precision for each query
-
-    :param results_ids: dictionary {query_id: [list of ids]}
-    :param results_gt: dictionary {query_id: [list of ids]}
-    :param k: int
-    :return: dictionary {query_id: r-precision}
-    """
-    precision_dict = dict()
-
-    for query_id, docs_id in results_ids.items():
-        # current ground truth
-        gt = results_gt[query_id]
-
-        # handle case of number of gt ids < k
-        k = min(k, len(gt))
-
-        docs_id = docs_id[:k]
-
-        relevant_returned = len(list(set(gt).intersection(set(docs_id))))
-        precision_dict[query_id] = relevant_returned / k
-
-    return precision_dict
-
-
-def compute_stats(d):
-    """ Return a dictionary of aggregate stats on d
-
-    :param d: dictionary {int: float}
-        expects a dictionary of {query_id: value} returned from either
-        precision_at_k or recall_at_k
-    :return: dictionary {string: float}
+    :param run: Run object
+    :param gt: Qrels object
+    :param keep_missing: bool
+        if True the queries of gt without results are kept with no documents,
+        so they score 0; the original dict based code did the same, because its
+        results were a defaultdict(list). If False only the queries both in gt
+        and in run are kept
+    :return: Run object
     """
-    vals = list(d.values())
-
-    stats = {'min': np.min(vals),
-             'max': np.max(vals),
-             'mean': np.mean(vals),
-             'median': np.median(vals),
-             'first_quartile': np.quantile(vals, 0.25),
-             'third_quartile': np.quantile(vals, 0.75)}
+    if keep_missing:
+        return run.select(gt.query_ids)
 
-    return stats
+    return run.select(gt.query_ids[np.isin(gt.query_ids, run.query_ids)])
 
 
 def print_stats(stats_list, title):
@@ -160,19 +39,30 @@ def print_stats(stats_list, title):
     print()
 
 
-def fscore_from_pr(precision, recall):
-    """ Computes the F1-score
+def print_significance(comparison, title, alpha=0.05):
+    """ Prints to console the confidence intervals of the engines and the
+        significance of their pairwise differences
 
-    :param precision: list of floats
-    :param recall: list of floats
-    :return: float
+    :param comparison: dictionary
+        output of compare_engines()
+    :param title: string
+    :param alpha: float
+        significance level of the tests
+    :return: None
     """
-    precision = np.array(list(precision.values()))
-    recall = np.array(list(recall.values()))
-    np.seterr(all="ignore")
-    fscore = (2 * precision * recall) / (precision + recall)
+    print(title)
+    print("N\tmean\tlow\thigh")
+
+    for i, (mean, low, high) in enumerate(comparison['ci']):
+        print(f"{i + 1}\t{mean:.2f}\t{low:.2f}\t{high:.2f}")
 
-    return fscore[~np.isnan(fscore)].mean()
+    print("Pair\tp-value\tadjusted")
+
+    for (i, j), p, adjusted in zip(comparison['pairs'], comparison['p_values'], comparison['adjusted']):
+        mark = "*" if adjusted < alpha else ""
+        print(f"{i + 1}-{j + 1}\t{p:.4f}\t{adjusted:.4f}{mark}")
+
+    print()
 
 
 def print_fscores(fscore):
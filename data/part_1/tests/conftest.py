@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from whoosh import index
+from whoosh.analysis import StandardAnalyzer
+from build_index import get_schema
+
+# zipfian vocabulary, so that queries mix frequent and rare terms
+VOCABULARY = np.array([f"w{i}" for i in range(500)])
+FREQUENCIES = 1 / np.arange(1, len(VOCABULARY) + 1) / np.sum(1 / np.arange(1, len(VOCABULARY) + 1))
+FIELDBOOSTS = {'title': 2.0, 'content': 1.0}
+
+
+def random_text(rng, low, high):
+    return " ".join(rng.choice(VOCABULARY, rng.integers(low, high), p=FREQUENCIES))
+
+
+@pytest.fixture(scope="session")
+def cranfield_ix(tmp_path_factory):
+    """ Index with the cranfield schema of random titles and contents """
+    rng = np.random.default_rng(0)
+    ix = index.create_in(str(tmp_path_factory.mktemp("index")), get_schema('cranfield', StandardAnalyzer()))
+
+    with ix.writer() as writer:
+        for doc_id in range(1, 301):
+            writer.add_document(id=str(doc_id), title=random_text(rng, 3, 10), content=random_text(rng, 20, 150))
+
+    return ix
+
+
+@pytest.fixture(scope="session")
+def cranfield_queries():
+    rng = np.random.default_rng(1)
+    return {query_id: random_text(rng, 2, 6) for query_id in range(1, 41)}
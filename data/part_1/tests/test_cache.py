@@ -0,0 +1,49 @@
+from multiprocessing import Pool
+import numpy as np
+import evaluation
+from evaluation.cache import cache_pathname
+
+
+def write_qrels(pathname, n_queries=2000):
+    rng = np.random.default_rng(0)
+
+    with open(pathname, "w") as f:
+        f.write("Query_id\tRelevant_Doc_id\n")
+        for query_id in range(1, n_queries + 1):
+            for doc_id in rng.choice(1000, rng.integers(1, 30), replace=False).tolist():
+                f.write(f"{query_id}\t{doc_id}\n")
+
+
+def load_qrels(pathname):
+    qrels = evaluation.load_ground_truth(pathname)
+    return qrels.query_ids, qrels.offsets, qrels.doc_ids
+
+
+def test_concurrent_loads_on_cold_cache(tmp_path):
+    pathname = str(tmp_path / "qrels.tsv")
+    write_qrels(pathname)
+    expected = evaluation.load_ground_truth(pathname, cache=False)
+
+    # every worker races to parse, write and read the same cache
+    with Pool(12) as pool:
+        results = pool.map(load_qrels, [pathname] * 720, chunksize=1)
+
+    for query_ids, offsets, doc_ids in results:
+        assert np.array_equal(query_ids, expected.query_ids)
+        assert np.array_equal(offsets, expected.offsets)
+        assert np.array_equal(doc_ids, expected.doc_ids)
+
+    # no temporary file is left behind
+    assert [p.name for p in (tmp_path / ".cache").iterdir()] == ["qrels.tsv.qrels.npz"]
+
+
+def test_corrupted_cache_is_a_miss(tmp_path):
+    pathname = str(tmp_path / "qrels.tsv")
+    write_qrels(pathname, 10)
+    expected = evaluation.load_ground_truth(pathname)
+
+    for content in [b"", b"PK\x03\x04 truncated", b"not a zip file"]:
+        with open(cache_pathname(pathname, 'qrels'), "wb") as f:
+            f.write(content)
+
+        assert np.array_equal(evaluation.load_ground_truth(pathname).doc_ids, expected.doc_ids)
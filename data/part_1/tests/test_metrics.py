@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from utils import Metrics, K_VAL, recall_at_k, precision_at_k, mean_reciprocal_rank, mean_ndcg
+
+
+# per query reference implementations, the baseline ones fixed for queries
+# without relevant documents and for results shorter than k
+
+def reference_reciprocal_rank(ids, gt):
+    for rank, doc_id in enumerate(ids, 1):
+        if doc_id in gt:
+            return 1 / rank
+    return 0.0
+
+
+def reference_recall(ids, gt, k):
+    return len(set(gt) & set(ids[:k])) / len(gt) if len(gt) > 0 else 0.0
+
+
+def reference_precision(ids, gt, k=None):
+    k = len(gt) if k is None else k
+    return len(set(gt) & set(ids[:k])) / k if k > 0 else 0.0
+
+
+def reference_ndcg(ids, gt, k):
+    norm = 1 + sum(1 / np.log2(x + 1) for x in range(1, k))
+    total = sum(int(doc_id in gt) / (1 if i == 0 else np.log2(i + 1)) for i, doc_id in enumerate(ids[:k]))
+    return total / norm
+
+
+@pytest.fixture(params=[0, 1, 2])
+def random_run(request):
+    """ Random results and ground truth, with queries without relevant
+        documents and results shorter than the largest k """
+    rng = np.random.default_rng(request.param)
+    results_ids, results_gt = {}, {}
+
+    for query_id in rng.permutation(60)[:40].tolist():
+        results_ids[query_id] = rng.permutation(50)[:rng.integers(0, 15)].tolist()
+        results_gt[query_id] = rng.permutation(50)[:rng.integers(0, 8)].tolist()
+
+    return results_ids, results_gt
+
+
+def test_metrics_match_reference(random_run):
+    results_ids, results_gt = random_run
+    m = Metrics("simple", "test", "bm25f")
+    m.compute_metrics(results_ids, results_gt)
+
+    queries = list(results_ids.keys())
+    assert any(len(results_gt[q]) == 0 for q in queries)
+    assert any(len(results_ids[q]) < max(K_VAL) for q in queries)
+
+    mrr = np.mean([reference_reciprocal_rank(results_ids[q], results_gt[q]) for q in queries])
+    assert m.MRR == pytest.approx(mrr)
+
+    for q in queries:
+        assert m.rp[q] == pytest.approx(reference_precision(results_ids[q], results_gt[q]))
+
+    for i, k in enumerate(K_VAL):
+        assert m.rp_at_k[i] == pytest.approx(np.mean([reference_precision(results_ids[q], results_gt[q], k)
+                                                      for q in queries]))
+        assert m.r_at_k[i] == pytest.approx(np.mean([reference_recall(results_ids[q], results_gt[q], k)
+                                                     for q in queries]))
+        assert m.ndcg_at_k[i] == pytest.approx(np.mean([reference_ndcg(results_ids[q], results_gt[q], k)
+                                                        for q in queries]))
+
+
+def test_wrappers_match_reference(random_run):
+    results_ids, results_gt = random_run
+    queries = list(results_ids.keys())
+
+    assert mean_reciprocal_rank(results_ids, results_gt) == pytest.approx(
+        np.mean([reference_reciprocal_rank(results_ids[q], results_gt[q]) for q in queries]))
+
+    r_precision = precision_at_k(results_ids, results_gt)
+    assert r_precision == pytest.approx({q: reference_precision(results_ids[q], results_gt[q]) for q in queries})
+
+    for k in K_VAL:
+        assert precision_at_k(results_ids, results_gt, k) == pytest.approx(
+            {q: reference_precision(results_ids[q], results_gt[q], k) for q in queries})
+        assert recall_at_k(results_ids, results_gt, k) == pytest.approx(
+            {q: reference_recall(results_ids[q], results_gt[q], k) for q in queries})
+        assert mean_ndcg(results_ids, results_gt, k) == pytest.approx(
+            np.mean([reference_ndcg(results_ids[q], results_gt[q], k) for q in queries]))
@@ -0,0 +1,17 @@
+import pytest
+from whoosh import scoring
+from conftest import FIELDBOOSTS
+from utils import query_parser, top_results
+
+
+@pytest.mark.parametrize("limit", [1, 3, 10])
+def test_top_results_matches_exhaustive_search(cranfield_ix, cranfield_queries, limit):
+    with cranfield_ix.searcher(weighting=scoring.BM25F()) as searcher:
+        qp = query_parser(cranfield_ix.schema, FIELDBOOSTS)
+
+        for q in cranfield_queries.values():
+            parsed_query = qp.parse(q)
+            limited = [(hit['id'], hit.score) for hit in top_results(searcher, parsed_query, limit)]
+            exhaustive = [(hit['id'], hit.score) for hit in top_results(searcher, parsed_query, None)][:limit]
+
+            assert limited == exhaustive
@@ -0,0 +1,26 @@
+import pytest
+from whoosh import scoring
+from conftest import FIELDBOOSTS
+from sweep import extract_postings, bm25_sweep
+from utils import get_results_ids
+
+QUERIES = {101: "w1 OR w7", 102: "missingword", 103: "w3 AND w40"}
+
+
+@pytest.mark.parametrize("B,K1", [(0.75, 1.2), (0.0, 0.5), (1.0, 3.0)])
+@pytest.mark.parametrize("limit", [10, None])
+def test_bm25_sweep_matches_whoosh(cranfield_ix, cranfield_queries, B, K1, limit):
+    queries = {**cranfield_queries, **QUERIES}
+    postings, doc_ids = extract_postings(cranfield_ix, queries, FIELDBOOSTS)
+    [swept] = bm25_sweep(postings, doc_ids, [(B, K1)], limit)
+
+    searched = get_results_ids(cranfield_ix, scoring.BM25F(B=B, K1=K1), queries, FIELDBOOSTS, limit)
+
+    for query_id in queries:
+        assert swept[query_id] == searched[query_id]
+
+
+@pytest.mark.parametrize("q", ['"w1 w2"', "w1*", "w?", "w1 NOT w2"])
+def test_extract_postings_rejects_unsupported_queries(cranfield_ix, q):
+    with pytest.raises(ValueError):
+        extract_postings(cranfield_ix, {1: q}, FIELDBOOSTS)
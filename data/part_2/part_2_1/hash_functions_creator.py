@@ -1,5 +1,6 @@
-import random
-import math
+import argparse
+import sys
+import numpy as np
 
 
 ################################################
@@ -8,35 +9,110 @@ upper_bound_on_number_of_distinct_elements  = 10000000
 #upper_bound_on_number_of_distinct_elements =   138492
 #upper_bound_on_number_of_distinct_elements =  3746518
 
+# bases 2, 3, 5 and 7 make Miller-Rabin deterministic below this bound
+MILLER_RABIN_BASES = [2, 3, 5, 7]
+MILLER_RABIN_LIMIT = 3215031751
+
 ################################################
 
 
-### primality checker
-def is_prime(number):
-	if number == 2:
-		return True
-	if (number % 2) == 0:
-		return False
-	for j in range(3, int(math.sqrt(number)+1), 2):
-		if (number % j) == 0: 
-			return False
-	return True
+### vectorized modular exponentiation, values below 2^32 so products fit 64 bits
+def power_mod(base, exponent, modulus):
+	result = np.ones_like(modulus)
+	base = base % modulus
+	exponent = exponent.copy()
+	while (exponent > 0).any():
+		odd = (exponent & 1) == 1
+		result = np.where(odd, result * base % modulus, result)
+		base = base * base % modulus
+		exponent >>= 1
+	return result
+
+
+### primality checker of a whole array of numbers below MILLER_RABIN_LIMIT
+def is_prime(numbers):
+	numbers = np.asarray(numbers, dtype=np.uint64)
+	if numbers.max(initial=0) >= MILLER_RABIN_LIMIT:
+		raise ValueError(f"Miller-Rabin with bases {MILLER_RABIN_BASES} is exact only below {MILLER_RABIN_LIMIT}")
+
+	prime = (numbers >= 2) & ((numbers % 2 == 1) | (numbers == 2))
+	candidates = prime & ~np.isin(numbers, MILLER_RABIN_BASES)
+	n = np.where(candidates, numbers, 3)
+
+	# n - 1 = d * 2^s with d odd
+	d = n - 1
+	s = np.zeros_like(n)
+	while ((d % 2 == 0) & candidates).any():
+		even = (d % 2 == 0) & candidates
+		d = np.where(even, d >> 1, d)
+		s += even
+
+	for a in MILLER_RABIN_BASES:
+		x = power_mod(np.full_like(n, a), d, n)
+		witness = (x != 1) & (x != n - 1)
+		for r in range(1, int(s.max(initial=0))):
+			x = x * x % n
+			witness &= ~((x == n - 1) & (r < s))
+		prime &= ~(witness & candidates)
+
+	return prime
+
+
+### random primes in [low, high], drawn uniformly among the primes by rejection
+def random_primes(rng, count, low, high):
+	primes = np.empty(0, dtype=np.int64)
+	while len(primes) < count:
+		# about 1 / ln(high) of the candidates are prime
+		candidates = rng.integers(low, high, size=max(2 * count * int(np.log(high)), 1024), endpoint=True)
+		primes = np.concatenate([primes, candidates[is_prime(candidates)]])
+	return primes[:count]
+
+
+### distinct hash functions (a, b, p) for h(x) = (a * x + b) % p, reproducible from the seed
+def create_hash_functions(count=num_hash_functions, n=upper_bound_on_number_of_distinct_elements, seed=None):
+	rng = np.random.default_rng(seed)
+	functions = np.empty((0, 3), dtype=np.int64)
+	while len(functions) < count:
+		missing = count - len(functions)
+		a = rng.integers(1, n - 1, size=missing, endpoint=True)
+		b = rng.integers(0, n - 1, size=missing, endpoint=True)
+		p = random_primes(rng, missing, n, 10 * n)
+		functions = np.concatenate([functions, np.column_stack([a, b, p])])
+		# drop repeated functions, keeping the order in which they were drawn
+		_, first = np.unique(functions, axis=0, return_index=True)
+		functions = functions[np.sort(first)]
+	return functions
+
+
+def write_tsv(functions, n, f):
+	f.write("a\tb\tp\tn\n")
+	for a, b, p in functions.tolist():
+		f.write(str(a) + "\t" + str(b) + "\t" + str(p) + "\t" + str(n) + "\n")
 
 
+def parse_args():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-k", "--num-hash-functions", type=int, default=num_hash_functions)
+	parser.add_argument("-n", "--upper-bound", type=int, default=upper_bound_on_number_of_distinct_elements,
+						help="Upper bound on the number of distinct elements, p is a prime in [n, 10n]")
+	parser.add_argument("-s", "--seed", type=int, default=None)
+	parser.add_argument("-o", "--output", type=str, default=None,
+						help="Output tsv file, standard output if missing")
+	parser.add_argument("--npy", type=str, default=None,
+						help="Also save the functions as a numpy array of rows (a, b, p, n)")
+	return parser.parse_args()
 
-set_of_all_hash_functions = set()
-while len(set_of_all_hash_functions) < num_hash_functions:
-	a = random.randint(1, upper_bound_on_number_of_distinct_elements-1)
-	b = random.randint(0, upper_bound_on_number_of_distinct_elements-1)
-	p = random.randint(upper_bound_on_number_of_distinct_elements, 10*upper_bound_on_number_of_distinct_elements)
-	while is_prime(p) == False:
-		p = random.randint(upper_bound_on_number_of_distinct_elements, 10*upper_bound_on_number_of_distinct_elements)
-	#
-	current_hash_function_id = tuple([a, b, p])
-	set_of_all_hash_functions.add(current_hash_function_id)
 
+if __name__ == "__main__":
+	args = parse_args()
+	functions = create_hash_functions(args.num_hash_functions, args.upper_bound, args.seed)
 
-print("a\tb\tp\tn")
-for a, b ,p in set_of_all_hash_functions:
-	print(str(a) + "\t" + str(b) + "\t" + str(p) + "\t" + str(upper_bound_on_number_of_distinct_elements))
+	if args.output is None:
+		write_tsv(functions, args.upper_bound, sys.stdout)
+	else:
+		with open(args.output, "w") as f:
+			write_tsv(functions, args.upper_bound, f)
 
+	if args.npy is not None:
+		n = np.full((len(functions), 1), args.upper_bound, dtype=np.int64)
+		np.save(args.npy, np.hstack([functions, n]))
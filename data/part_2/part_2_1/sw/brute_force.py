@@ -0,0 +1,199 @@
+from utils import *
+from lsh import jaccard_similarity, write_near_duplicates_tsv
+from time import time
+
+# data of the join in each worker process, set by _init_join_worker()
+_join = {}
+
+
+def frequency_order(offsets, ids):
+    """ Renames the shingles by increasing frequency and sorts the songs by size,
+        so that the prefixes of the sets are made of rare shingles
+
+    :param offsets: numpy array of ints
+    :param ids: numpy array of ints
+        CSR shingles, see load_shingles_npy()
+    :return: triple (order, offsets, tokens) of numpy arrays
+        order[i] is the original index of the i-th song by size, the shingles of
+        song order[i] are tokens[offsets[i]:offsets[i + 1]] sorted by frequency
+    """
+    unique, inverse, counts = np.unique(np.asarray(ids), return_inverse=True, return_counts=True)
+
+    # rank of each shingle, rare first and ties broken by id
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[np.argsort(counts, kind="stable")] = np.arange(len(unique))
+
+    lengths = np.diff(offsets)
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    new_offsets = np.concatenate([[0], np.cumsum(sorted_lengths)])
+
+    # shingles of the songs in size order, sorted by rank within each song
+    positions = np.repeat(offsets[:-1][order] - new_offsets[:-1], sorted_lengths) + np.arange(new_offsets[-1])
+    tokens = rank[inverse.ravel()[positions]]
+    songs = np.repeat(np.arange(len(order)), sorted_lengths)
+    tokens = tokens[np.lexsort((tokens, songs))]
+
+    return order, new_offsets, tokens
+
+
+def prefix_lengths(lengths, threshold):
+    """ Returns the prefix length of sets of the given sizes: two sets with
+        jaccard >= threshold share a shingle in their prefixes
+
+    :param lengths: numpy array of ints
+    :param threshold: float
+    :return: numpy array of ints
+    """
+    return lengths - np.ceil(threshold * lengths - 1e-9).astype(np.int64) + 1
+
+
+def prefix_index(offsets, tokens, threshold):
+    """ Builds the inverted index of the prefixes of all the songs
+
+    :param offsets: numpy array of ints
+    :param tokens: numpy array of ints
+        output of frequency_order()
+    :param threshold: float
+    :return: dictionary of numpy arrays
+        the songs having token index['tokens'][k] in their prefix are
+        index['songs'][index['offsets'][k]:index['offsets'][k + 1]], and
+        index['positions'] is the position of the token in each of them
+    """
+    lengths = np.diff(offsets)
+    prefixes = np.minimum(prefix_lengths(lengths, threshold), lengths)
+
+    songs = np.repeat(np.arange(len(lengths)), prefixes)
+    positions = np.arange(prefixes.sum()) - np.repeat(np.cumsum(prefixes) - prefixes, prefixes)
+    prefix_tokens = tokens[offsets[songs] + positions]
+
+    order = np.lexsort((songs, prefix_tokens))
+    unique, starts = np.unique(prefix_tokens[order], return_index=True)
+
+    return {'tokens': unique,
+            'offsets': np.concatenate([starts, [len(order)]]),
+            'songs': songs[order],
+            'positions': positions[order]}
+
+
+def probe(x, offsets, tokens, index, threshold):
+    """ Returns the candidates of song x among the smaller songs, with prefix,
+        length and positional filtering
+
+    :param x: int
+        song index, in size order
+    :param offsets: numpy array of ints
+    :param tokens: numpy array of ints
+        output of frequency_order()
+    :param index: dictionary
+        output of prefix_index()
+    :param threshold: float
+    :return: numpy array of song indices
+    """
+    size = offsets[x + 1] - offsets[x]
+    prefix = tokens[offsets[x]:offsets[x] + min(prefix_lengths(size, threshold), size)]
+
+    # posting lists of the prefix shingles, in prefix order
+    k = np.searchsorted(index['tokens'], prefix)
+    k = k[(k < len(index['tokens'])) & (index['tokens'][np.minimum(k, len(index['tokens']) - 1)] == prefix)]
+    starts, ends = index['offsets'][k], index['offsets'][k + 1]
+    counts = ends - starts
+
+    postings = np.repeat(starts - np.cumsum(np.concatenate([[0], counts[:-1]])), counts) + np.arange(counts.sum())
+    candidates = index['songs'][postings]
+    position_y = index['positions'][postings]
+    position_x = np.repeat(np.flatnonzero(np.isin(prefix, index['tokens'][k])), counts)
+
+    # length filter: smaller songs only, processed before x, and not too small
+    min_size = np.ceil(threshold * size - 1e-9)
+    sizes = offsets[candidates + 1] - offsets[candidates]
+    keep = (candidates < x) & (sizes >= min_size)
+    candidates, position_x, position_y, sizes = candidates[keep], position_x[keep], position_y[keep], sizes[keep]
+
+    # positional filter: after their first shared shingle, x and y can share at
+    # most min(|x| - i, |y| - j) shingles, where i and j are its positions
+    candidates, first = np.unique(candidates, return_index=True)
+    bound = np.minimum(size - position_x[first], sizes[first] - position_y[first])
+    overlap = np.ceil(threshold / (1 + threshold) * (size + sizes[first]) - 1e-9)
+
+    return candidates[bound >= overlap]
+
+
+def _init_join_worker(offsets, tokens, index, threshold):
+    """ Initializer of the worker processes of all_pairs() """
+    _join.update(offsets=offsets, tokens=tokens, index=index, threshold=threshold)
+
+
+def _probe_range(job):
+    """ Finds the near duplicates of the songs in [start, end), run by a
+        worker of all_pairs()
+
+    :param job: pair (start, end) of song indices, in size order
+    :return: triple (first, second, similarity) of numpy arrays
+    """
+    start, end = job
+    offsets, tokens, index, threshold = _join['offsets'], _join['tokens'], _join['index'], _join['threshold']
+
+    pairs = [(np.full(len(c), x), c) for x in range(start, end)
+             for c in [probe(x, offsets, tokens, index, threshold)]]
+    first = np.concatenate([p[0] for p in pairs]) if pairs else np.empty(0, dtype=np.int64)
+    second = np.concatenate([p[1] for p in pairs]) if pairs else np.empty(0, dtype=np.int64)
+
+    # exact verification of all the candidates at once
+    similarity = jaccard_similarity(offsets, tokens, first, second)
+    found = similarity >= threshold
+
+    return first[found], second[found], similarity[found]
+
+
+def all_pairs(offsets, ids, threshold, procs=4, chunk_size=2000):
+    """ Exact similarity join: returns all the pairs of songs with jaccard
+        similarity >= threshold, as AllPairs/PPJoin
+
+    :param offsets: numpy array of ints
+    :param ids: numpy array of ints
+        CSR shingles, see load_shingles_npy()
+    :param threshold: float
+    :param procs: int
+        worker processes
+    :param chunk_size: int
+        songs probed by a worker at once
+    :return: triple (first, second, similarity) of numpy arrays
+        pairs of original song indices with first < second, sorted
+    """
+    order, offsets, tokens = frequency_order(offsets, ids)
+    index = prefix_index(offsets, tokens, threshold)
+
+    n_songs = len(order)
+    jobs = [(start, min(start + chunk_size, n_songs)) for start in range(0, n_songs, chunk_size)]
+
+    # every worker receives the index once and probes ranges of songs
+    with Pool(procs, initializer=_init_join_worker, initargs=(offsets, tokens, index, threshold)) as pool:
+        results = list(tqdm(pool.imap_unordered(_probe_range, jobs), total=len(jobs)))
+
+    first = order[np.concatenate([r[0] for r in results] + [np.empty(0, dtype=np.int64)])]
+    second = order[np.concatenate([r[1] for r in results] + [np.empty(0, dtype=np.int64)])]
+    similarity = np.concatenate([r[2] for r in results] + [np.empty(0)])
+
+    first, second = np.minimum(first, second), np.maximum(first, second)
+    sort = np.lexsort((second, first))
+
+    return first[sort], second[sort], similarity[sort]
+
+
+if __name__ == "__main__":
+    # read parameters from command line
+    args = brute_force_config()
+
+    tic = time()
+
+    print(f"Loading shingles from {args.input}")
+    song_ids, offsets, ids = load_shingles(args.input)
+
+    print(f"Joining {len(song_ids)} songs at jaccard >= {args.threshold} with {args.procs} processes")
+    first, second, similarity = all_pairs(offsets, ids, args.threshold, args.procs, args.chunk_size)
+
+    write_near_duplicates_tsv(args.output, song_ids, np.diff(offsets), first, second, similarity)
+
+    elapsed = time() - tic
+    print(f"Found {len(first)} near duplicates in {elapsed:0.2f} seconds")
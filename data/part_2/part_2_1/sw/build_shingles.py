@@ -1,14 +1,16 @@
 from utils import *
 from time import time
 
-if __name__ == "__main__":
-    # read parameters from command line
-    args = build_shingles_config()
 
-    tic = time()
+def build_in_memory(args):
+    """ Loads all the songs, then assigns the shingle identifiers and writes them
 
+    :param args: argparse namespace, output of build_shingles_config()
+    :return: int
+        number of rows written
+    """
     print(f"Reading shingles from {args.input}")
-    songs_list = shingles_from_tsv(field="lyrics")
+    songs_list = shingles_from_tsv(args.field, args.input)
 
     print(f"Creating shingle id dictionary for {len(songs_list)} shingles")
     shingles_ids = shingles_id_from_list(songs_list)
@@ -21,18 +23,89 @@ if __name__ == "__main__":
         songs_shingles_ids_list.append(shingles_as_list(shingles_ids, shingles_list))
 
     print(f"Writing shingles to {args.output}")
+    song_ids = [song.get_id() for song in songs_list]
+
+    return SHINGLES_WRITERS[args.format](args.output, tqdm(zip(song_ids, songs_shingles_ids_list)))
+
+
+def shingle_ids(args):
+    """ Returns the object assigning the shingle identifiers
+
+    :param args: argparse namespace, output of build_shingles_config()
+    :return: ShingleVocabulary or ShingleHasher object
+    """
+    if args.hash_bits is None:
+        return ShingleVocabulary()
+
+    print(f"Using {args.hash_bits} bits {args.hash} hashes as shingle ids")
+    return ShingleHasher(args.hash_bits, args.hash, report=args.collisions)
+
+
+def print_vocabulary(vocabulary):
+    """ Prints to console the number of shingles found, and the collisions
+        of a ShingleHasher that keeps them
+
+    :param vocabulary: ShingleVocabulary or ShingleHasher object
+    :return: None
+    """
+    if isinstance(vocabulary, ShingleVocabulary):
+        print(f"Found {len(vocabulary)} distinct shingles")
+    elif vocabulary.seen is not None:
+        report = vocabulary.collision_report()
+        print(f"Found {report['shingles']} distinct shingles, {report['hashes']} distinct hashes")
+        print(f"Colliding shingles: {report['colliding']} ({report['rate']:.2e}), "
+              f"expected colliding pairs: {report['expected']:.2e}")
+
+
+def build_streaming(args):
+    """ Reads, shingles and writes one song at a time, only the shingle
+        vocabulary is kept in memory, nothing with hashed ids
 
-    with open(args.output, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile, delimiter='\t')
-        writer.writerow(["ID", "ELEMENTS_IDS"])
+    :param args: argparse namespace, output of build_shingles_config()
+    :return: int
+        number of rows written
+    """
+    print(f"Streaming shingles from {args.input} to {args.output}")
+    vocabulary = shingle_ids(args)
 
-        for i, song in tqdm(enumerate(songs_list)):
-            song_id = song.get_id()
-            id_list = songs_shingles_ids_list[i]
+    songs = ((song_id, vocabulary.ids_of(shingles))
+             for song_id, shingles in tqdm(stream_shingles(args.field, args.input)))
+    written = SHINGLES_WRITERS[args.format](args.output, songs)
+
+    print_vocabulary(vocabulary)
+    return written
+
+
+def build_parallel(args):
+    """ Shingles chunks of songs in worker processes and writes them in order,
+        the output is the same of build_streaming()
+
+    :param args: argparse namespace, output of build_shingles_config()
+    :return: int
+        number of rows written
+    """
+    print(f"Shingling {args.input} with {args.procs} processes to {args.output}")
+    vocabulary = shingle_ids(args)
+
+    songs = parallel_shingles(args.field, args.input, args.procs, args.chunk_size, vocabulary)
+    written = SHINGLES_WRITERS[args.format](args.output, tqdm(songs))
+
+    print_vocabulary(vocabulary)
+    return written
+
+
+if __name__ == "__main__":
+    # read parameters from command line
+    args = build_shingles_config()
+
+    tic = time()
 
-            # save to file non-empty lists
-            if len(id_list) > 0:
-                writer.writerow([f"id_{song_id}", id_list])
+    if args.mode == "memory":
+        written = build_in_memory(args)
+    elif args.mode == "parallel":
+        written = build_parallel(args)
+    else:
+        written = build_streaming(args)
 
     elapsed = time() - tic
-    print(f"Finished in {elapsed:0.2f} seconds")
\ No newline at end of file
+    print(f"Wrote {written} songs in {elapsed:0.2f} seconds")
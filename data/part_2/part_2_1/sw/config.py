@@ -4,6 +4,15 @@ LYRICS_COL = 5
 TITLE_COL = 1
 SONGS_PATH = "../../dataset/250K_lyrics_from_MetroLyrics.csv"
 
+# files of the binary shingles format, inside the output directory
+SHINGLES_IDS = "ids.npy"
+SHINGLES_OFFSETS = "offsets.npy"
+SHINGLES_SONGS = "songs.npy"
+
+# signature matrix of the minhash output directory, next to SHINGLES_SONGS
+SIGNATURES = "signatures.npy"
+HASH_FUNCTIONS_PATH = "../hash_functions/300.tsv"
+
 
 def analysis_config():
     """ Read parameters from command line
@@ -25,6 +34,94 @@ def build_shingles_config():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", type=str, default=SONGS_PATH,
                         help="Input filename.tsv")
-    parser.add_argument("-o", "--output", type=str, help="Output filename.tsv")
+    parser.add_argument("-o", "--output", type=str, help="Output filename.tsv, or directory with --format npy")
+    parser.add_argument("--format", type=str, default="tsv", choices=["tsv", "npy"],
+                        help="tsv is read by NearDuplicatesDetector, npy writes memory mappable arrays")
+    parser.add_argument("-f", "--field", type=str, default="lyrics", choices=["lyrics", "title"],
+                        help="Field from which shingles are built")
+    parser.add_argument("-m", "--mode", type=str, default="streaming", choices=["streaming", "parallel", "memory"],
+                        help="streaming writes each song as it is read, parallel shingles chunks of songs "
+                             "in worker processes, memory loads all the songs first")
+    parser.add_argument("-p", "--procs", type=int, default=4,
+                        help="Worker processes of the parallel mode")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="Songs sent to a worker at once in the parallel mode")
+    parser.add_argument("--hash-bits", type=int, default=None, choices=[32, 64],
+                        help="Use the 32 or 64 bits hash of a shingle as its id instead of a vocabulary")
+    parser.add_argument("--hash", type=str, default="blake2b", choices=["blake2b", "xxhash"],
+                        help="Hash function of --hash-bits, xxhash requires the xxhash package")
+    parser.add_argument("--collisions", action="store_true",
+                        help="Report the hash collisions, keeps every shingle in memory")
+
+    args = parser.parse_args()
+
+    if args.hash_bits is not None and args.mode == "memory":
+        parser.error("--hash-bits is supported by the streaming and parallel modes")
+
+    if args.collisions and (args.hash_bits is None or args.mode != "streaming"):
+        parser.error("--collisions requires --hash-bits and the streaming mode")
+
+    return args
+
+
+def minhash_config():
+    """ Read parameters from command line
+
+    :return: argparse.Parser object
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, required=True,
+                        help="Shingles tsv file, or directory written by build_shingles.py --format npy")
+    parser.add_argument("-f", "--hash-functions", type=str, default=HASH_FUNCTIONS_PATH,
+                        help="Tsv file of the (a, b, p) hash functions")
+    parser.add_argument("-o", "--output", type=str, default="./signatures",
+                        help="Output directory of the signature matrix")
+    parser.add_argument("--chunk-size", type=int, default=1 << 15,
+                        help="Shingle ids hashed at once, bounds the memory used")
+
+    return parser.parse_args()
+
+
+def lsh_config():
+    """ Read parameters from command line
+
+    :return: argparse.Parser object
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--signatures", type=str, default="./signatures",
+                        help="Directory written by minhash.py")
+    parser.add_argument("-i", "--input", type=str, default=None,
+                        help="Shingles of the songs, if given the candidates are verified with their exact "
+                             "jaccard similarity instead of the one estimated from the signatures")
+    parser.add_argument("-t", "--threshold", type=float, default=0.95,
+                        help="Minimum jaccard similarity of near duplicates")
+    parser.add_argument("-r", "--rows", type=int, nargs="+", default=[5],
+                        help="Rows per band, every combination with --bands is evaluated")
+    parser.add_argument("-b", "--bands", type=int, nargs="+", default=[10],
+                        help="Number of bands")
+    parser.add_argument("-g", "--ground-truth", type=str, default=None,
+                        help="Near duplicates tsv used to compute detection probability, false positives and negatives")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Output near duplicates tsv, suffixed with _r<rows>_b<bands> for more combinations")
+
+    return parser.parse_args()
+
+
+def brute_force_config():
+    """ Read parameters from command line
+
+    :return: argparse.Parser object
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, required=True,
+                        help="Shingles tsv file, or directory written by build_shingles.py --format npy")
+    parser.add_argument("-t", "--threshold", type=float, default=0.95,
+                        help="Minimum jaccard similarity of near duplicates")
+    parser.add_argument("-o", "--output", type=str, default="./BRUTE_FORCE_near_duplicates.tsv",
+                        help="Output near duplicates tsv")
+    parser.add_argument("-p", "--procs", type=int, default=4,
+                        help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=2000,
+                        help="Songs probed by a worker at once")
 
     return parser.parse_args()
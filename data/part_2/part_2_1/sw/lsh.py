@@ -0,0 +1,273 @@
+from utils import *
+from minhash import load_signatures
+from time import time
+
+
+def band_pairs(band):
+    """ Returns the pairs of songs whose band falls in the same bucket
+
+    :param band: numpy array S x r
+        slice of r columns of the signature matrix
+    :return: pair (first, second) of numpy arrays of song indices, first < second
+    """
+    # bucket of each song: songs share a bucket when their band is identical
+    _, buckets = np.unique(band, axis=0, return_inverse=True)
+    buckets = buckets.ravel()
+
+    order = np.argsort(buckets, kind="stable")
+    sorted_buckets = buckets[order]
+    n = len(order)
+
+    starts = np.flatnonzero(np.concatenate([[True], sorted_buckets[1:] != sorted_buckets[:-1]]))
+    sizes = np.diff(np.concatenate([starts, [n]]))
+
+    # each position is paired with all the following positions of its bucket
+    counts = np.repeat(starts + sizes, sizes) - np.arange(n) - 1
+    first = np.repeat(np.arange(n), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    first, second = order[first], order[second]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def candidate_pairs(signatures, rows, bands):
+    """ Returns the candidate pairs of LSH with bands of rows consecutive hashes
+
+        Band i covers the same columns for any number of bands, so the first
+        band finding a pair gives its candidates for every smaller setting
+
+    :param signatures: numpy array S x H, with rows * bands <= H
+    :param rows: int
+    :param bands: int
+    :return: triple (first, second, first_band) of numpy arrays
+        distinct pairs of song indices and the first band where they collide
+    """
+    n_songs = len(signatures)
+    keys, band_ids = [], []
+
+    for i in range(bands):
+        first, second = band_pairs(np.asarray(signatures[:, i * rows:(i + 1) * rows]))
+        keys.append(first * n_songs + second)
+        band_ids.append(np.full(len(first), i))
+
+    # return_index gives the first occurrence, bands are concatenated in order
+    keys, index = np.unique(np.concatenate(keys), return_index=True)
+    first_band = np.concatenate(band_ids)[index]
+
+    return keys // n_songs, keys % n_songs, first_band
+
+
+def gather(offsets, ids, songs):
+    """ Returns the concatenated shingles of songs
+
+    :param offsets: numpy array of ints
+    :param ids: numpy array of ints
+        CSR shingles, see load_shingles_npy()
+    :param songs: numpy array of song indices
+    :return: pair (values, lengths) of numpy arrays
+    """
+    lengths = offsets[songs + 1] - offsets[songs]
+    ends = np.cumsum(lengths)
+
+    positions = np.repeat(offsets[songs] - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+    return np.asarray(ids[positions]), lengths
+
+
+def jaccard_similarity(offsets, ids, first, second, batch_size=1 << 16):
+    """ Returns the exact jaccard similarity of the pairs of songs
+
+        The shingles of both songs of every pair of a batch are tagged with the
+        pair and sorted together, the shared shingles are adjacent duplicates
+
+    :param offsets: numpy array of ints
+    :param ids: numpy array of ints
+        CSR shingles with sorted distinct ids per song, see load_shingles_npy()
+    :param first: numpy array of song indices
+    :param second: numpy array of song indices
+    :param batch_size: int
+        pairs verified at once
+    :return: numpy array of floats
+    """
+    similarity = np.empty(len(first))
+
+    for start in range(0, len(first), batch_size):
+        end = min(start + batch_size, len(first))
+        values_1, lengths_1 = gather(offsets, ids, first[start:end])
+        values_2, lengths_2 = gather(offsets, ids, second[start:end])
+
+        pairs = np.arange(end - start)
+        tags = np.concatenate([np.repeat(pairs, lengths_1), np.repeat(pairs, lengths_2)])
+        values = np.concatenate([values_1, values_2])
+
+        order = np.lexsort((values, tags))
+        tags, values = tags[order], values[order]
+        shared = (tags[1:] == tags[:-1]) & (values[1:] == values[:-1])
+
+        intersection = np.bincount(tags[1:][shared], minlength=end - start)
+        union = lengths_1 + lengths_2 - intersection
+        similarity[start:end] = intersection / np.maximum(union, 1)
+
+    return similarity
+
+
+def signature_similarity(signatures, first, second, batch_size=1 << 14):
+    """ Returns the jaccard similarity of the pairs of songs estimated as the
+        fraction of equal minhashes
+
+    :param signatures: numpy array S x H
+    :param first: numpy array of song indices
+    :param second: numpy array of song indices
+    :param batch_size: int
+        pairs compared at once
+    :return: numpy array of floats
+    """
+    similarity = np.empty(len(first))
+
+    for start in range(0, len(first), batch_size):
+        end = min(start + batch_size, len(first))
+        similarity[start:end] = (signatures[first[start:end]] == signatures[second[start:end]]).mean(axis=1)
+
+    return similarity
+
+
+def near_duplicates_dict(song_ids, first, second, similarity):
+    """ Returns the pairs in the form of load_near_duplicates_tsv()
+
+    :param song_ids: numpy array of ints
+    :param first: numpy array of song indices
+    :param second: numpy array of song indices
+    :param similarity: numpy array of floats
+    :return: nested dictionary, dict[id_1][id_2] = jaccard_similarity(id_1, id_2)
+    """
+    near_duplicates = defaultdict(dict)
+
+    for id_1, id_2, jaccard in zip(song_ids[first].tolist(), song_ids[second].tolist(), similarity.tolist()):
+        near_duplicates[id_1][id_2] = jaccard
+
+    return near_duplicates
+
+
+def write_near_duplicates_tsv(pathname, song_ids, sizes, first, second, similarity):
+    """ Writes the pairs in the format read by load_near_duplicates_tsv()
+
+    :param pathname: string
+        output tsv file with header and rows "jaccard id_1 size_1 id_2 size_2"
+    :param song_ids: numpy array of ints
+    :param sizes: numpy array of ints
+        number of shingles of each song, or signature length without shingles
+    :param first: numpy array of song indices
+    :param second: numpy array of song indices
+    :param similarity: numpy array of floats
+    :return: None
+    """
+    with open(pathname, "w", newline="") as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(["jaccard", "name_set_1", "size_set_1", "name_set_2", "size_set_2"])
+
+        writer.writerows(zip(similarity.tolist(), song_ids[first].tolist(), sizes[first].tolist(),
+                             song_ids[second].tolist(), sizes[second].tolist()))
+
+
+def lsh_sweep(signatures, settings, similarity_function, threshold):
+    """ Runs LSH for every (rows, bands) setting, the candidates of all the
+        settings with the same rows are found once and each candidate pair
+        is verified once
+
+    :param signatures: numpy array S x H
+    :param settings: list of pairs (rows, bands), rows * bands <= H
+    :param similarity_function: function (first, second) -> numpy array of floats
+        jaccard similarity of the candidate pairs
+    :param threshold: float
+    :return: dictionary {(rows, bands): dictionary}
+        'candidates' number of candidate pairs, all of them are verified,
+        'lsh_time' seconds to find the candidates of all the settings with the
+        same rows, 'verify_time' seconds to verify the candidates of the
+        setting, 'pairs' triple (first, second, similarity) of the detected
+        near duplicates, sorted
+    """
+    results = {}
+
+    for rows in sorted(set(r for r, _ in settings)):
+        bands_list = sorted(b for r, b in settings if r == rows)
+
+        tic = time()
+        first, second, first_band = candidate_pairs(signatures, rows, bands_list[-1])
+        lsh_time = time() - tic
+
+        # the candidates of a setting are a prefix once sorted by first band,
+        # each setting verifies only the ones its predecessor did not
+        order = np.argsort(first_band, kind="stable")
+        first, second, first_band = first[order], second[order], first_band[order]
+        similarity = np.empty(len(first))
+        verify_time = 0.0
+        verified = 0
+
+        for bands in bands_list:
+            n_candidates = int(np.searchsorted(first_band, bands))
+
+            tic = time()
+            similarity[verified:n_candidates] = similarity_function(first[verified:n_candidates],
+                                                                    second[verified:n_candidates])
+            verify_time += time() - tic
+            verified = n_candidates
+
+            detected = np.flatnonzero(similarity[:n_candidates] >= threshold)
+            detected = detected[np.lexsort((second[detected], first[detected]))]
+
+            results[(rows, bands)] = {'candidates': n_candidates,
+                                      'lsh_time': lsh_time,
+                                      'verify_time': verify_time,
+                                      'pairs': (first[detected], second[detected], similarity[detected])}
+
+    return results
+
+
+if __name__ == "__main__":
+    # read parameters from command line
+    args = lsh_config()
+
+    song_ids, signatures = load_signatures(args.signatures)
+    n_hashes = signatures.shape[1]
+
+    settings = [(r, b) for r in args.rows for b in args.bands if r * b <= n_hashes]
+    print(f"LSH of {len(song_ids)} songs with {n_hashes} minhashes, {len(settings)} (rows, bands) settings")
+
+    if args.input is not None:
+        print(f"Verifying candidates with the shingles of {args.input}")
+        shingle_songs, offsets, ids = load_shingles(args.input)
+        assert(np.array_equal(shingle_songs, song_ids))
+
+        sizes = np.diff(offsets)
+
+        def similarity_function(first, second):
+            return jaccard_similarity(offsets, ids, first, second)
+    else:
+        sizes = np.full(len(song_ids), n_hashes)
+
+        def similarity_function(first, second):
+            return signature_similarity(signatures, first, second)
+
+    gt = load_near_duplicates_tsv(args.ground_truth) if args.ground_truth is not None else None
+    results = lsh_sweep(signatures, settings, similarity_function, args.threshold)
+
+    print("rows\tbands\tP(s)\tcandidates\tdetected\tlsh_time\tverify_time\tprob\tFP\tFN")
+
+    for (rows, bands), result in results.items():
+        first, second, similarity = result['pairs']
+
+        # probability that a pair with similarity equal to the threshold is a candidate
+        s_curve = 1 - (1 - args.threshold ** rows) ** bands
+        line = f"{rows}\t{bands}\t{s_curve:.3f}\t{result['candidates']}\t{len(first)}\t" \
+               f"{result['lsh_time']:.2f}\t{result['verify_time']:.2f}"
+
+        if gt is not None:
+            pred = near_duplicates_dict(song_ids, first, second, similarity)
+            prob, false_pos, false_neg = near_duplicates_stats(gt, pred)
+            line += f"\t{prob:.3f}\t{false_pos}\t{false_neg}"
+
+        print(line)
+
+        if args.output is not None:
+            pathname = args.output if len(results) == 1 else \
+                args.output.replace(".tsv", "") + f"_r{rows}_b{bands}.tsv"
+            write_near_duplicates_tsv(pathname, song_ids, sizes, first, second, similarity)
@@ -0,0 +1,134 @@
+from utils import *
+from time import time
+
+
+def load_hash_functions(pathname):
+    """ Loads the hash functions h(x) = (a * x + b) % p written by hash_functions_creator.py
+
+    :param pathname: string
+        tsv file with header and rows "a b p n", or .npy file of the same rows
+    :return: triple (a, b, p) of numpy arrays of ints
+    """
+    if pathname.endswith(".npy"):
+        functions = np.load(pathname).astype(np.int64)
+    else:
+        functions = np.loadtxt(pathname, delimiter='\t', skiprows=1, dtype=np.int64, ndmin=2)
+
+    # 32 bits signatures and no overflow of a * (x % p) in 64 bits
+    assert(functions[:, 2].max(initial=0) < 2 ** 31 and functions[:, 0].max(initial=0) < 2 ** 31)
+
+    return functions[:, 0], functions[:, 1], functions[:, 2]
+
+
+def song_chunks(offsets, chunk_size):
+    """ Splits the songs in consecutive chunks of at most chunk_size shingles,
+        a song with more shingles is a chunk by itself
+
+    :param offsets: numpy array of ints
+        offsets of the CSR shingles, see load_shingles_npy()
+    :param chunk_size: int
+    :return: list of pairs (first song, last song + 1)
+    """
+    chunks = []
+    start = 0
+    n_songs = len(offsets) - 1
+
+    while start < n_songs:
+        # last song that ends within chunk_size shingles from the start of the chunk
+        end = int(np.searchsorted(offsets, offsets[start] + chunk_size, side="right")) - 1
+        end = min(max(end, start + 1), n_songs)
+        chunks.append((start, end))
+        start = end
+
+    return chunks
+
+
+def minhash_chunk(ids, offsets, a, b, p):
+    """ Returns the minhash signatures of a chunk of songs
+
+    :param ids: numpy array of ints
+        the shingle ids of the songs of the chunk
+    :param offsets: numpy array of ints
+        offsets of the songs in ids, starting from 0
+    :param a: numpy array of H ints
+    :param b: numpy array of H ints
+    :param p: numpy array of H ints
+    :return: numpy array S x H of uint32
+        minimum of every hash function over the shingles of each song
+    """
+    p = p[:, None]
+
+    # H x M hashes of all the shingles, x % p first is the same modulo p and
+    # keeps the product in 64 bits for hashed shingle ids
+    hashes = (a[:, None] * (ids[None, :] % p) + b[:, None]) % p
+
+    # the signature of empty songs is the maximum, reduceat runs on the others
+    # only since it returns a single element for an empty slice
+    non_empty = np.diff(offsets) > 0
+    signatures = np.full((len(non_empty), len(a)), np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    if non_empty.any():
+        signatures[non_empty] = np.minimum.reduceat(hashes, offsets[:-1][non_empty], axis=1).T
+
+    return signatures
+
+
+def minhash_signatures(song_ids, offsets, ids, hash_functions, directory, chunk_size=1 << 15):
+    """ Computes the signature matrix of the songs and saves it memory mapped
+
+    :param song_ids: numpy array of S ints
+    :param offsets: numpy array of S + 1 ints
+    :param ids: numpy array of ints
+        the shingles of song_ids[i] are ids[offsets[i]:offsets[i + 1]]
+    :param hash_functions: triple (a, b, p), output of load_hash_functions()
+    :param directory: string
+        output directory, it will contain SIGNATURES and SHINGLES_SONGS
+    :param chunk_size: int
+        shingle ids hashed at once, the memory used is 8 * H * chunk_size bytes
+    :return: numpy memmap S x H of uint32
+    """
+    a, b, p = hash_functions
+    os.makedirs(directory, exist_ok=True)
+
+    np.save(os.path.join(directory, SHINGLES_SONGS), np.asarray(song_ids, dtype=np.int64))
+    signatures = open_memmap(os.path.join(directory, SIGNATURES), mode="w+", dtype=np.uint32,
+                             shape=(len(song_ids), len(a)))
+
+    for start, end in tqdm(song_chunks(offsets, chunk_size)):
+        chunk_ids = np.asarray(ids[offsets[start]:offsets[end]], dtype=np.int64)
+        signatures[start:end] = minhash_chunk(chunk_ids, offsets[start:end + 1] - offsets[start], a, b, p)
+
+    signatures.flush()
+    return signatures
+
+
+def load_signatures(directory, mmap=True):
+    """ Loads the signatures written by minhash_signatures()
+
+    :param directory: string
+    :param mmap: bool
+        if True the signature matrix is memory mapped instead of read
+    :return: pair (song_ids, signatures) of numpy arrays
+    """
+    song_ids = np.load(os.path.join(directory, SHINGLES_SONGS))
+    signatures = np.load(os.path.join(directory, SIGNATURES), mmap_mode="r" if mmap else None)
+
+    return song_ids, signatures
+
+
+if __name__ == "__main__":
+    # read parameters from command line
+    args = minhash_config()
+
+    tic = time()
+
+    print(f"Loading shingles from {args.input}")
+    song_ids, offsets, ids = load_shingles(args.input)
+
+    hash_functions = load_hash_functions(args.hash_functions)
+    print(f"Computing {len(hash_functions[0])} minhashes of {len(song_ids)} songs")
+
+    minhash_signatures(song_ids, offsets, ids, hash_functions, args.output, args.chunk_size)
+
+    elapsed = time() - tic
+    print(f"Saved signatures to {args.output} in {elapsed:0.2f} seconds")
@@ -1,8 +1,13 @@
+import os
 import csv
 import string
+import numpy as np
+from numpy.lib.format import open_memmap
+from hashlib import blake2b
 from tqdm import tqdm
-from itertools import chain
-from collections import defaultdict
+from itertools import chain, islice
+from multiprocessing import Pool
+from collections import defaultdict, deque
 from config import *
 
 translate_table = dict((ord(char), None) for char in string.punctuation.replace("'", ""))
@@ -27,10 +32,10 @@ class Song(object):
         self.id = int(row[0])
 
         if field == "title":
-            self.title = preprocess(row[1], remove_dash=True)
+            self.title = preprocess(row[TITLE_COL], remove_dash=True)
             self.shingles = create_shingles(self.title, keep_short=True)
         else:
-            self.lyrics = preprocess(row[5])
+            self.lyrics = preprocess(row[LYRICS_COL])
             self.shingles = create_shingles(self.lyrics)
 
     def get_shingles(self):
@@ -80,27 +85,248 @@ def create_shingles(s, length=3, keep_short=False):
     return [tuple(tokens[i:i + length]) for i in range(len(tokens) - (length-1))]
 
 
-def shingles_from_tsv(field):
+def song_shingles(row, field):
+    """ Returns the shingles of a song, the same of Song(row, field).get_shingles()
+        without keeping the preprocessed text
+
+    :param row: row of tsv with 6 columns "ID","song","year","artist","genre","lyrics"
+    :param field: string
+        can be either "title" or "lyrics", is the field used to create the shingle
+    :return: list of tuples of strings
+    """
+    if field == "title":
+        return create_shingles(preprocess(row[TITLE_COL], remove_dash=True), keep_short=True)
+
+    return create_shingles(preprocess(row[LYRICS_COL]))
+
+
+def read_songs(pathname=SONGS_PATH):
+    """ Yields the rows of the songs dataset one at a time
+
+    :param pathname: string
+        csv file with header and 6 columns "ID","song","year","artist","genre","lyrics"
+    :return: generator of lists of strings
+    """
+    with open(pathname) as f:
+        # open csv file and skip header
+        reader = csv.reader(f)
+        next(reader)
+
+        yield from reader
+
+
+def shingles_from_tsv(field, pathname=SONGS_PATH):
     """ Returns a list of shingles generated from songs dataset
 
     :param field: string
         the tsv field from which shingles should be generated
+    :param pathname: string
+        the songs dataset
     :return: list of Song objects
     """
     assert(field in ["title", "lyrics"])
 
-    songs_list = []
+    return [Song(row, field) for row in tqdm(read_songs(pathname))]
 
-    with open(SONGS_PATH) as f:
-        # open csv file and skip header
-        reader = csv.reader(f)
-        next(reader)
 
-        # iterate over rows
-        for row in tqdm(reader):
-            songs_list.append(Song(row, field))
+def stream_shingles(field, pathname=SONGS_PATH):
+    """ Yields the shingles of the songs dataset one song at a time
+
+    :param field: string
+        the tsv field from which shingles should be generated
+    :param pathname: string
+        the songs dataset
+    :return: generator of pairs (song_id, list of tuples of strings)
+    """
+    assert(field in ["title", "lyrics"])
+
+    for row in read_songs(pathname):
+        yield int(row[0]), song_shingles(row, field)
+
+
+class ShingleVocabulary(object):
+    def __init__(self):
+        """ Assigns to each shingle an incremental identifier, in order of first
+            occurrence, while the songs are read """
+        self.ids = {}
+
+    def ids_of(self, shingle_list):
+        """ Returns the sorted identifiers of the shingles in shingle_list,
+            new shingles get the next free identifiers
+
+        :param shingle_list: list of tuples of strings
+        :return: list of ints
+        """
+        ids = self.ids
+        return sorted(set([ids.setdefault(s, len(ids)) for s in shingle_list]))
+
+    def merge(self, shingles):
+        """ Adds the shingles of a local vocabulary, in their order
+
+        :param shingles: list of tuples of strings
+            the shingles of a local vocabulary sorted by local identifier
+        :return: list of ints
+            the global identifier of each local identifier
+        """
+        ids = self.ids
+        return [ids.setdefault(s, len(ids)) for s in shingles]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def shingle_hash_function(bits=64, algorithm="blake2b"):
+    """ Returns a function mapping a shingle to a stable integer identifier,
+        the same in every process and every run
+
+    :param bits: int
+        32 or 64, identifiers are lower than 2 ** (bits - 1) so that they fit
+        a signed integer of that size
+    :param algorithm: string
+        "blake2b" from the standard library or "xxhash", which requires the
+        xxhash package
+    :return: function (tuple of strings) -> int
+    """
+    assert(bits in [32, 64])
+    mask = (1 << (bits - 1)) - 1
+
+    if algorithm == "xxhash":
+        import xxhash
+        digest = xxhash.xxh32_intdigest if bits == 32 else xxhash.xxh64_intdigest
+
+        return lambda shingle: digest(" ".join(shingle).encode()) & mask
+
+    assert(algorithm == "blake2b")
+    size = bits // 8
+
+    return lambda shingle: int.from_bytes(blake2b(" ".join(shingle).encode(), digest_size=size).digest(),
+                                          "little") & mask
+
+
+class ShingleHasher(object):
+    def __init__(self, bits=64, algorithm="blake2b", report=False):
+        """ Assigns to each shingle the hash of its words, so that no vocabulary
+            is needed, same interface of ShingleVocabulary
+
+        :param bits: int
+            32 or 64, see shingle_hash_function()
+        :param algorithm: string
+            see shingle_hash_function()
+        :param report: bool
+            if True the shingle of every hash is kept to count the collisions,
+            this takes the memory of a vocabulary
+        """
+        self.bits = bits
+        self.algorithm = algorithm
+        self.hash = shingle_hash_function(bits, algorithm)
+        self.seen = {} if report else None
+        self.colliding = set()
+
+    def ids_of(self, shingle_list):
+        """ Returns the sorted hashes of the shingles in shingle_list
+
+        :param shingle_list: list of tuples of strings
+        :return: list of ints
+        """
+        ids = [self.hash(s) for s in shingle_list]
+
+        if self.seen is not None:
+            for s, h in zip(shingle_list, ids):
+                if self.seen.setdefault(h, s) != s:
+                    self.colliding.add(s)
+
+        return sorted(set(ids))
+
+    def collision_report(self):
+        """ Returns the collisions found, requires report=True
+
+        :return: dictionary
+            'shingles' distinct shingles, 'hashes' distinct hashes, 'colliding'
+            shingles that share the hash of a previous one, 'rate' their fraction
+            and 'expected' the number of colliding pairs of a uniform hash
+        """
+        assert(self.seen is not None)
+
+        shingles = len(self.seen) + len(self.colliding)
+
+        return {'shingles': shingles,
+                'hashes': len(self.seen),
+                'colliding': len(self.colliding),
+                'rate': len(self.colliding) / max(shingles, 1),
+                'expected': shingles * (shingles - 1) / 2 / 2 ** (self.bits - 1)}
+
+
+def shingle_chunk(job):
+    """ Shingles a chunk of songs with a local vocabulary, run by a worker
+        of parallel_shingles()
+
+    :param job: triple (rows, field, hashing)
+        rows of the songs dataset, field used to create the shingles and
+        pair (bits, algorithm) of ShingleHasher, None to use a vocabulary
+    :return: triple (song_ids, id_lists, shingles)
+        the local identifiers of the shingles of each song and the shingles
+        of the local vocabulary sorted by local identifier; with hashing the
+        identifiers are already global and shingles is None
+    """
+    rows, field, hashing = job
+    vocabulary = ShingleVocabulary() if hashing is None else ShingleHasher(*hashing)
+
+    id_lists = [vocabulary.ids_of(song_shingles(row, field)) for row in rows]
+    shingles = list(vocabulary.ids) if hashing is None else None
+
+    return [int(row[0]) for row in rows], id_lists, shingles
 
-    return songs_list
+
+def parallel_shingles(field, pathname=SONGS_PATH, procs=4, chunk_size=1000, vocabulary=None):
+    """ Yields the shingle identifiers of the songs dataset, shingling chunks
+        of songs in parallel
+
+        The local vocabularies are merged in chunk order, so every shingle gets
+        the identifier of its first occurrence in the dataset: the output is the
+        same of stream_shingles() followed by ShingleVocabulary.ids_of().
+        With a ShingleHasher there is nothing to merge, the workers hash the
+        shingles directly
+
+    :param field: string
+        the tsv field from which shingles should be generated
+    :param pathname: string
+        the songs dataset
+    :param procs: int
+        number of worker processes
+    :param chunk_size: int
+        songs shingled by a worker at once
+    :param vocabulary: ShingleVocabulary or ShingleHasher object
+        global vocabulary, filled while the songs are yielded
+    :return: generator of pairs (song_id, list of ints)
+    """
+    assert(field in ["title", "lyrics"])
+
+    vocabulary = ShingleVocabulary() if vocabulary is None else vocabulary
+    hashing = (vocabulary.bits, vocabulary.algorithm) if isinstance(vocabulary, ShingleHasher) else None
+    rows = read_songs(pathname)
+    chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+
+    with Pool(procs) as pool:
+        # at most two chunks per worker are in flight, Pool.imap would read
+        # the whole dataset ahead of the writer
+        pending = deque()
+
+        for chunk in chain(chunks, [None]):
+            if chunk is not None:
+                pending.append(pool.apply_async(shingle_chunk, ((chunk, field, hashing),)))
+
+            while pending and (len(pending) > 2 * procs or chunk is None):
+                # chunks are merged in order
+                song_ids, id_lists, shingles = pending.popleft().get()
+
+                if shingles is None:
+                    yield from zip(song_ids, id_lists)
+                    continue
+
+                remap = vocabulary.merge(shingles)
+
+                for song_id, id_list in zip(song_ids, id_lists):
+                    yield song_id, sorted([remap[i] for i in id_list])
 
 
 def shingles_id_from_list(songs_list):
@@ -126,6 +352,145 @@ def shingles_as_list(id_dict, shingle_list):
     return sorted(list(set([id_dict[s] for s in shingle_list])))
 
 
+def write_shingles_tsv(pathname, songs):
+    """ Writes the shingles identifiers of the songs in the format read by
+        NearDuplicatesDetector, songs without shingles are skipped
+
+    :param pathname: string
+        output tsv file with header and rows "id_<song_id> [id, id, ...]"
+    :param songs: iterable of pairs (song_id, list of ints)
+        it is consumed while writing, so it can be a generator
+    :return: int
+        number of rows written
+    """
+    written = 0
+
+    with open(pathname, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter='\t')
+        writer.writerow(["ID", "ELEMENTS_IDS"])
+
+        for song_id, id_list in songs:
+            # save to file non-empty lists
+            if len(id_list) > 0:
+                writer.writerow([f"id_{song_id}", id_list])
+                written += 1
+
+    return written
+
+
+def write_shingles_npy(directory, songs, buffer_size=1 << 20):
+    """ Writes the shingles identifiers of the songs in CSR form: the shingles
+        of songs[i] are ids[offsets[i]:offsets[i + 1]], songs without shingles
+        are skipped
+
+        The identifiers are streamed to a raw temporary file while the songs are
+        read, then copied into the .npy file once their number is known
+
+    :param directory: string
+        output directory, it will contain SHINGLES_IDS, SHINGLES_OFFSETS and SHINGLES_SONGS
+    :param songs: iterable of pairs (song_id, list of ints)
+        it is consumed while writing, so it can be a generator
+    :param buffer_size: int
+        identifiers buffered before writing them to disk
+    :return: int
+        number of songs written
+    """
+    os.makedirs(directory, exist_ok=True)
+    ids_path = os.path.join(directory, SHINGLES_IDS)
+    raw_path = ids_path + ".tmp"
+
+    song_ids, lengths, buffer = [], [], []
+
+    with open(raw_path, "wb") as f:
+        for song_id, id_list in songs:
+            # save to file non-empty lists
+            if len(id_list) > 0:
+                song_ids.append(song_id)
+                lengths.append(len(id_list))
+                buffer.extend(id_list)
+
+                if len(buffer) >= buffer_size:
+                    np.array(buffer, dtype=np.int64).tofile(f)
+                    buffer = []
+
+        np.array(buffer, dtype=np.int64).tofile(f)
+
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+    ids = open_memmap(ids_path, mode="w+", dtype=np.int64, shape=(int(offsets[-1]),))
+
+    if len(ids) > 0:
+        raw = np.memmap(raw_path, dtype=np.int64, mode="r", shape=ids.shape)
+
+        for start in range(0, len(ids), buffer_size):
+            ids[start:start + buffer_size] = raw[start:start + buffer_size]
+
+        del raw
+
+    ids.flush()
+    del ids
+    os.remove(raw_path)
+
+    np.save(os.path.join(directory, SHINGLES_OFFSETS), offsets)
+    np.save(os.path.join(directory, SHINGLES_SONGS), np.array(song_ids, dtype=np.int64))
+
+    return len(song_ids)
+
+
+def load_shingles_npy(directory, mmap=True):
+    """ Loads the shingles written by write_shingles_npy()
+
+    :param directory: string
+    :param mmap: bool
+        if True the arrays are memory mapped instead of read
+    :return: triple (song_ids, offsets, ids) of numpy arrays
+        the shingles of song_ids[i] are ids[offsets[i]:offsets[i + 1]]
+    """
+    mmap_mode = "r" if mmap else None
+
+    return tuple(np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+                 for name in [SHINGLES_SONGS, SHINGLES_OFFSETS, SHINGLES_IDS])
+
+
+def load_shingles_tsv(pathname):
+    """ Loads the shingles written by write_shingles_tsv() in the same form
+        of load_shingles_npy()
+
+    :param pathname: string
+    :return: triple (song_ids, offsets, ids) of numpy arrays
+    """
+    song_ids, lengths, ids = [], [], []
+
+    with open(pathname) as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)
+
+        for song, id_list in reader:
+            values = id_list[1:-1].replace(',', ' ').split()
+            song_ids.append(int(song[len("id_"):]))
+            lengths.append(len(values))
+            ids.extend(values)
+
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+    return np.array(song_ids, dtype=np.int64), offsets, np.array(ids, dtype=np.int64)
+
+
+def load_shingles(pathname):
+    """ Loads the shingles written by build_shingles.py in either format
+
+    :param pathname: string
+        tsv file or directory of the npy format
+    :return: triple (song_ids, offsets, ids) of numpy arrays
+        see load_shingles_npy()
+    """
+    if os.path.isdir(pathname):
+        return load_shingles_npy(pathname)
+
+    return load_shingles_tsv(pathname)
+
+
+SHINGLES_WRITERS = {'tsv': write_shingles_tsv, 'npy': write_shingles_npy}
+
+
 #########################################################
 # FUNCTIONS TO LOAD OUTPUT OF NEAR DUPLICATES DETECTION #
 #########################################################
@@ -161,7 +526,8 @@ def near_duplicates_stats(gt, pred):
     :param pred: dictionary
         output of load_near_duplicates_tsv()
     :return: float, int, int
-        1. detection probability = detected_pairs / ground_truth_pairs
+        1. detection probability = detected_pairs / ground_truth_pairs,
+           nan if the ground truth has no pairs
         2. false positives
         3. false negatives
     """
@@ -185,6 +551,6 @@ def near_duplicates_stats(gt, pred):
         for id_2 in nd_dict.keys():
             false_positives += int(id_1 not in gt[id_2] and id_2 not in gt[id_1])
 
-    detection_prob = total_detected / total_near_duplicates
+    detection_prob = total_detected / total_near_duplicates if total_near_duplicates > 0 else float("nan")
 
     return detection_prob, false_positives, false_negatives
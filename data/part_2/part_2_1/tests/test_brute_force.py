@@ -0,0 +1,43 @@
+from itertools import combinations
+import numpy as np
+import pytest
+from brute_force import all_pairs
+
+
+def naive_join(songs, threshold):
+    """ Pairs of non empty songs with jaccard similarity >= threshold, comparing all the pairs """
+    pairs = {}
+
+    for i, j in combinations(range(len(songs)), 2):
+        a, b = set(songs[i]), set(songs[j])
+
+        if a and b and len(a & b) / len(a | b) >= threshold:
+            pairs[(i, j)] = len(a & b) / len(a | b)
+
+    return pairs
+
+
+@pytest.fixture(scope="module")
+def songs():
+    """ Random sets and copies of them with a few shingles changed, so that
+        there are pairs at every threshold, plus some empty songs """
+    rng = np.random.default_rng(0)
+    songs = [rng.choice(200, rng.integers(1, 20), replace=False).tolist() for _ in range(60)]
+
+    for song in list(songs):
+        copy = [x for x in song if rng.random() > 0.1] + rng.choice(200, rng.integers(0, 2)).tolist()
+        songs.append(sorted(set(copy)))
+
+    return songs + [[], []]
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0])
+def test_all_pairs_matches_naive(songs, threshold):
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in songs])]).astype(np.int64)
+    ids = np.array([x for s in songs for x in s], dtype=np.int64)
+
+    first, second, similarity = all_pairs(offsets, ids, threshold, procs=2, chunk_size=16)
+    expected = naive_join(songs, threshold)
+
+    assert list(zip(first.tolist(), second.tolist())) == sorted(expected)
+    assert similarity == pytest.approx([expected[pair] for pair in sorted(expected)])
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+import pytest
+from lsh import candidate_pairs, lsh_sweep, signature_similarity
+from utils import near_duplicates_stats
+
+
+def naive_candidate_pairs(signatures, rows, bands):
+    """ First band where each pair of songs has identical rows, comparing all the pairs """
+    pairs = {}
+
+    for i, j in combinations(range(len(signatures)), 2):
+        for band in range(bands):
+            columns = slice(band * rows, (band + 1) * rows)
+
+            if np.array_equal(signatures[i, columns], signatures[j, columns]):
+                pairs[(i, j)] = band
+                break
+
+    return pairs
+
+
+@pytest.mark.parametrize("seed,rows,bands", [(0, 1, 6), (1, 2, 3), (2, 3, 2), (3, 6, 1), (4, 2, 2)])
+def test_candidate_pairs_matches_naive(seed, rows, bands):
+    # few distinct values so that many bands collide
+    rng = np.random.default_rng(seed)
+    signatures = rng.integers(0, 3, (40, 6)).astype(np.uint32)
+
+    first, second, first_band = candidate_pairs(signatures, rows, bands)
+    found = dict(zip(zip(first.tolist(), second.tolist()), first_band.tolist()))
+
+    assert len(found) == len(first)
+    assert found == naive_candidate_pairs(signatures, rows, bands)
+
+
+def test_candidate_pairs_no_songs():
+    first, second, first_band = candidate_pairs(np.zeros((0, 4), dtype=np.uint32), 2, 2)
+    assert len(first) == len(second) == len(first_band) == 0
+
+
+def test_near_duplicates_stats():
+    gt, pred = defaultdict(dict), defaultdict(dict)
+    gt[1][2] = gt[3][4] = 1.0
+    pred[2][1] = pred[5][6] = 1.0
+
+    assert near_duplicates_stats(gt, pred) == (0.5, 1, 1)
+
+
+def test_near_duplicates_stats_empty_ground_truth():
+    pred = defaultdict(dict)
+    pred[1][2] = 1.0
+
+    prob, false_positives, false_negatives = near_duplicates_stats(defaultdict(dict), pred)
+    assert np.isnan(prob) and false_positives == 1 and false_negatives == 0
+
+
+def test_lsh_sweep_matches_each_setting():
+    rng = np.random.default_rng(0)
+    signatures = rng.integers(0, 3, (60, 12)).astype(np.uint32)
+    settings = [(2, 2), (2, 6), (2, 4), (3, 4), (1, 3)]
+
+    def similarity_function(first, second):
+        return signature_similarity(signatures, first, second)
+
+    results = lsh_sweep(signatures, settings, similarity_function, 0.4)
+
+    for rows, bands in settings:
+        first, second, _ = candidate_pairs(signatures, rows, bands)
+        similarity = similarity_function(first, second)
+        detected = similarity >= 0.4
+
+        assert results[(rows, bands)]['candidates'] == len(first)
+        for found, expected in zip(results[(rows, bands)]['pairs'], (first, second, similarity)):
+            assert np.array_equal(found, expected[detected])
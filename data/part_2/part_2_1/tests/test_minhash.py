@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from minhash import minhash_chunk, minhash_signatures
+
+P = np.array([101, 1009, 2147483647])
+A = np.array([3, 17, 48271])
+B = np.array([1, 5, 11])
+
+
+def naive_signatures(songs):
+    """ Minimum of every hash function over the shingles of each song, the
+        maximum uint32 for empty songs """
+    return np.array([[min(((a * x + b) % p for x in song), default=np.iinfo(np.uint32).max)
+                      for a, b, p in zip(A.tolist(), B.tolist(), P.tolist())] for song in songs], dtype=np.uint32)
+
+
+def csr(songs):
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in songs])]).astype(np.int64)
+    ids = np.array([x for s in songs for x in s], dtype=np.int64)
+    return offsets, ids
+
+
+@pytest.mark.parametrize("songs", [[[9, 8], []], [[], [9, 8]], [[], []], [[5]], [[], [7], [], [1, 2, 3], []]])
+def test_minhash_chunk_small(songs):
+    offsets, ids = csr(songs)
+    assert np.array_equal(minhash_chunk(ids, offsets, A, B, P), naive_signatures(songs))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_minhash_chunk_random(seed):
+    rng = np.random.default_rng(seed)
+    songs = [rng.integers(0, 2 ** 40, rng.integers(0, 6) * rng.integers(0, 2)).tolist() for _ in range(50)]
+    offsets, ids = csr(songs)
+
+    assert np.array_equal(minhash_chunk(ids, offsets, A, B, P), naive_signatures(songs))
+
+
+def test_minhash_signatures_chunks(tmp_path):
+    rng = np.random.default_rng(0)
+    songs = [rng.integers(0, 1000, rng.integers(0, 4) * rng.integers(0, 2)).tolist() for _ in range(40)]
+    offsets, ids = csr(songs)
+
+    # chunks of a few shingles, some of them made only of empty songs
+    signatures = minhash_signatures(np.arange(len(songs)), offsets, ids, (A, B, P), str(tmp_path), chunk_size=3)
+    assert np.array_equal(signatures, naive_signatures(songs))
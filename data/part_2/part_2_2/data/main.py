@@ -1,92 +1,248 @@
+import os
+import sys
 import csv
+import argparse
+import importlib.util
+import numpy as np
+from hashlib import blake2b
+from itertools import islice
 from collections import defaultdict
 from time import time
 from tqdm import tqdm
 
+# the binary shingles format is defined by part_2_1
+PART_2_1_SW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "part_2_1", "sw")
+
+
+def load_module(name, pathname):
+    """ Imports the module at pathname under name, so that it is not confused
+        with a module of the same file name elsewhere on sys.path
+
+    :param name: string
+    :param pathname: string
+    :return: module
+    """
+    spec = importlib.util.spec_from_file_location(name, pathname)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# part_2_1 comes first on sys.path for the config imported by its utils
+sys.path.insert(0, PART_2_1_SW)
+load_shingles_npy = load_module("part_2_1_utils", os.path.join(PART_2_1_SW, "utils.py")).load_shingles_npy
+
 TSV_FILENAME = "./title_shingles.tsv"
 
 
-def load_shingles_id_from_tsv(filename):
-    """ Returns a list of identifier associated to the shingles from filename
+def set_fingerprint(ids):
+    """ Returns a stable 128 bits fingerprint of a set of shingle ids, the same
+        in every process and run, unlike hash()
+
+    :param ids: sequence of ints
+    :return: bytes of length 16
+    """
+    canonical = np.unique(np.asarray(ids, dtype=np.int64)).astype("<i8")
+    return blake2b(canonical.tobytes(), digest_size=16).digest()
+
+
+def tsv_rows(filename):
+    """ Yields the shingle ids of each song of a tsv file, one at a time
 
     :param filename: string
-        filename containing the shingles generated from build_shingles.py
         first row is the header, the remaining rows are made of "song_id [shingle_ids]"
-    :return:
+    :return: generator of lists of ints
     """
-    id_lists = []
-
     with open(filename, "r") as f:
         reader = csv.reader(f, delimiter='\t')
         next(reader)
 
         for row in reader:
-            ids = list(map(int, row[1][1:-1].replace(',', '').split()))
-            id_lists.append(ids)
+            yield list(map(int, row[1][1:-1].replace(',', '').split()))
 
-    return id_lists
 
+def npy_rows(directory):
+    """ Yields the shingle ids of each song of the binary format, as views of
+        the memory mapped ids
 
-def count_duplicates(duplicates_list):
-    """ Return the number of exact duplicates song based on their shingles
+    :param directory: string
+    :return: generator of numpy arrays
+    """
+    _, offsets, ids = load_shingles_npy(directory)
 
-    :param duplicates_list: list of list of ints
-        each element of the list represents the list of shingles ids of a song
-    :return: int
-        return the count of exact duplicates found
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        yield ids[start:end]
+
+
+def shingle_rows(pathname):
+    """ Yields the shingle ids of each song of a tsv file or of a directory in binary format """
+    if os.path.isdir(pathname):
+        return npy_rows(pathname)
+
+    return tsv_rows(pathname)
+
+
+def fingerprint_groups(pathname):
+    """ Returns the groups of songs with the same fingerprint, the candidate
+        exact duplicates; only the fingerprints are kept in memory
+
+    :param pathname: string
+        shingles tsv file or directory in binary format
+    :return: list of numpy arrays of song indices
+        groups of at least two songs, in order of their first song
     """
-    return sum(list(map(lambda d_list: int(len(d_list) * (len(d_list)-1)/2), duplicates_list.values())))
+    fingerprints = np.fromiter((set_fingerprint(ids) for ids in tqdm(shingle_rows(pathname))), dtype="S16")
 
+    if len(fingerprints) == 0:
+        return []
 
-def find_duplicates(id_list):
-    """ Return the list of pairs of duplicates found
+    # equal fingerprints are adjacent once sorted, the stable sort keeps songs in order
+    order = np.argsort(fingerprints, kind="stable")
+    sorted_fingerprints = fingerprints[order]
 
-    :param id_list: list of list of ints
-        each element of the list represents the list of shingles ids of a song
-    :return: int
-        return the count of exact duplicates found
+    starts = np.flatnonzero(np.concatenate([[True], sorted_fingerprints[1:] != sorted_fingerprints[:-1]]))
+    groups = [g for g in np.split(order, starts[1:]) if len(g) > 1]
+
+    return sorted(groups, key=lambda g: g[0])
+
+
+def shingle_set(ids):
+    """ Returns the canonical bytes of a set of shingle ids, equal for equal sets
+
+    :param ids: sequence of ints
+    :return: bytes
     """
-    shingles_dict = defaultdict(list)
+    return np.unique(np.asarray(ids, dtype=np.int64)).tobytes()
+
 
-    for i, s in enumerate(id_list):
-        # cast to tuple to compute hash
-        t = tuple(s)
-        # increase duplicates count for shingle
-        shingles_dict[hash(t)].append(i)
+def split_identical(sets):
+    """ Returns the groups of songs with identical sets among the given ones
 
-    return shingles_dict
+    :param sets: iterable of pairs (song index, bytes of shingle_set())
+    :return: list of lists of song indices, groups of at least two songs
+    """
+    identical = defaultdict(list)
 
+    for i, ids in sets:
+        identical[ids].append(i)
 
-def duplicates_to_tsv(duplicates):
-    """ Saves duplicates to tsv file
+    return [songs for songs in identical.values() if len(songs) > 1]
 
-    :param duplicates: dict {id: list of ints}
-        a dictionary with hash as key and list of doc_ids as values
+
+def verified_groups(pathname, groups):
+    """ Yields the groups of songs with identical shingle sets, splitting the
+        fingerprint groups that hold different sets after a collision
+
+        The binary format is read group by group from the memory mapped ids,
+        a tsv file is read a second time and the sets of a group are kept
+        only until its last song is read
+
+    :param pathname: string
+        shingles tsv file or directory in binary format
+    :param groups: list of numpy arrays of song indices
+        output of fingerprint_groups()
+    :return: generator of lists of song indices
+        in order of the first song of the group for the binary format,
+        of the last one for a tsv file
+    """
+    if os.path.isdir(pathname):
+        _, offsets, ids = load_shingles_npy(pathname)
+
+        for g in groups:
+            yield from split_identical((i, shingle_set(ids[offsets[i]:offsets[i + 1]])) for i in g.tolist())
+        return
+
+    if len(groups) == 0:
+        return
+
+    # group of each candidate song, -1 for the others
+    group_of = np.full(max(g.max() for g in groups) + 1, -1)
+    for n, g in enumerate(groups):
+        group_of[g] = n
+
+    last = [int(g.max()) for g in groups]
+    open_groups = defaultdict(list)
+
+    for i, ids in enumerate(islice(tsv_rows(pathname), len(group_of))):
+        n = group_of[i]
+
+        if n < 0:
+            continue
+
+        open_groups[n].append((i, shingle_set(ids)))
+
+        if i == last[n]:
+            yield from split_identical(open_groups.pop(n))
+
+
+def count_duplicates(sizes):
+    """ Return the number of exact duplicates song based on their shingles
+
+    :param sizes: list of ints
+        size of each group of songs with identical shingles
+    :return: int
+        return the count of pairs of exact duplicates found
+    """
+    return sum(size * (size - 1) // 2 for size in sizes)
+
+
+def duplicates_to_tsv(duplicates, filename="exact_duplicates.tsv", groups=False):
+    """ Saves duplicates to tsv file while they are found
+
+    :param duplicates: iterable of lists of ints
+        groups of songs with identical shingles, it can be a generator
+    :param filename: string
+    :param groups: bool
+        if True writes a row "group id_set" for each song of a group, linear in the
+        number of songs, else a row "id_set_1 id_set_2" for each pair of a group
+
+        Both formats follow the order of duplicates and of the songs within
+        each group: groups are numbered in the order they are given, and the
+        pairs of a group come right after those of the previous group, each
+        song paired with all the songs following it in the group
+    :return: list of ints
+        size of each group
     """
-    with open("exact_duplicates.tsv", "w", newline='') as f:
+    sizes = []
+
+    with open(filename, "w", newline='') as f:
         writer = csv.writer(f, delimiter='\t')
-        writer.writerow(["id_set_1", "id_set_2"])
+        writer.writerow(["group", "id_set"] if groups else ["id_set_1", "id_set_2"])
+
+        for duplicate_group in duplicates:
+            sizes.append(len(duplicate_group))
+
+            if groups:
+                writer.writerows([len(sizes) - 1, id_1] for id_1 in duplicate_group)
+                continue
 
-        for duplicate_group in duplicates.values():
             for i, id_1 in enumerate(duplicate_group[:-1]):
                 for id_2 in duplicate_group[i+1:]:
                     writer.writerow([id_1, id_2])
 
+    return sizes
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, default=TSV_FILENAME,
+                        help="Shingles tsv file, or directory written by build_shingles.py --format npy")
+    parser.add_argument("-o", "--output", type=str, default="exact_duplicates.tsv")
+    parser.add_argument("-g", "--groups", action="store_true",
+                        help="Write one row per song of each group instead of all the pairs")
+    args = parser.parse_args()
+
     tic = time()
 
-    # load shingles
-    shingles_ids_list = load_shingles_id_from_tsv(TSV_FILENAME)
+    # fingerprint the shingle sets, songs with the same fingerprint are candidates
+    groups = fingerprint_groups(args.input)
 
-    # find exact duplicates
-    duplicates = find_duplicates(shingles_ids_list)
-    n_duplicates = count_duplicates(duplicates)
+    # verify the candidates and save them to tsv file while they are confirmed
+    print(f"Verifying {len(groups)} groups and saving duplicates to {args.output}")
+    sizes = duplicates_to_tsv(verified_groups(args.input, groups), args.output, args.groups)
+    n_duplicates = count_duplicates(sizes)
 
     elapsed = (time() - tic)
 
     print(f"Found {n_duplicates} duplicates in {elapsed:.2f} seconds")
-
-    # save to tsv file
-    print("Saving duplicates to tsv file...")
-    duplicates_to_tsv(duplicates)
\ No newline at end of file